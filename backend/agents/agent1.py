@@ -3,20 +3,42 @@ Agent 1: Case Analyzer
 Multimodal evidence processing and structured document generation
 REAL FILE PROCESSING WITH OPENAI API
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, UploadFile as StarletteUploadFile
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple, BinaryIO
 import os
 import json
 import base64
 import io
 import re
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 import tempfile
+import hashlib
+import heapq
+import random
+import time
 
-app = FastAPI(title="Agent 1 - Case Analyzer")
+# Fast JSON parsing for LLM responses (orjson errors subclass json.JSONDecodeError)
+# and orjson-serialized API responses
+try:
+    import orjson
+    json_loads = orjson.loads
+    ORJSON_AVAILABLE = True
+except ImportError:
+    json_loads = json.loads
+    ORJSON_AVAILABLE = False
+    print("Warning: orjson not available (optional, using json)")
+
+app = FastAPI(
+    title="Agent 1 - Case Analyzer",
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse,
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -32,10 +54,25 @@ OPENAI_API_KEY = "sk-i6oD0lB6SZmxYYAB9PoEQipoCdqUnUMG1QOkDRGAvNnl1y3D"
 
 # Try to import OpenAI
 try:
-    from openai import OpenAI
-    client = OpenAI(
+    import httpx
+    from openai import AsyncOpenAI, RateLimitError
+    try:
+        import h2  # noqa: F401 - enables HTTP/2 in httpx
+        HTTP2_AVAILABLE = True
+    except ImportError:
+        HTTP2_AVAILABLE = False
+    # One pooled HTTP transport shared by every OpenAI call so concurrent file
+    # analyses don't queue on the default connection limits; HTTP/2 multiplexes
+    # them over fewer connections when h2 is installed
+    _HTTP = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=128, max_keepalive_connections=64),
+        timeout=httpx.Timeout(60.0, connect=10.0)
+    )
+    client = AsyncOpenAI(
         api_key=OPENAI_API_KEY,
-        base_url="https://api.chatanywhere.tech/v1"
+        base_url="https://api.chatanywhere.tech/v1",
+        http_client=_HTTP
     )
     OPENAI_AVAILABLE = True
 except ImportError:
@@ -46,6 +83,7 @@ except ImportError:
 # Try to import file processing libraries
 try:
     import PyPDF2
+    from pdf_pages import extract_page_text, extract_pdf_pages
     PDF_AVAILABLE = True
 except ImportError:
     PDF_AVAILABLE = False
@@ -72,22 +110,112 @@ except ImportError:
     TESSERACT_AVAILABLE = False
     print("Warning: pytesseract not available (optional for OCR)")
 
+# Extracted PDF/DOCX text cache keyed by content hash (extraction is deterministic)
+try:
+    import diskcache
+    _TEXT_CACHE = diskcache.Cache(os.path.join(tempfile.gettempdir(), "agent1_text_cache"), size_limit=2**30)
+    TEXT_CACHE_AVAILABLE = True
+except ImportError:
+    _TEXT_CACHE = None
+    TEXT_CACHE_AVAILABLE = False
+    print("Warning: diskcache not available (optional, extracted text will not be cached)")
+
+# Markdown code fence around JSON in LLM responses
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL)
+
+def strip_json_fence(response_text: str) -> str:
+    """Return the JSON payload of an LLM response, unwrapping a markdown fence if present"""
+    match = _JSON_FENCE_RE.search(response_text)
+    return (match.group(1) if match else response_text).strip()
+
+# Keywords used by the fallback extractor to flag potential legal issues
+LEGAL_KEYWORDS = ['violation', 'breach', 'crime', 'illegal', 'fraud', 'negligence',
+                  'contract', 'lawsuit', 'liability', 'damages', 'evidence', 'witness',
+                  'testimony', 'allegation', 'charge', 'conviction', 'sentence']
+
+# Sentence splitter and name heuristic used by the fallback extractor
+_SENT_RE = re.compile(r'[.!?]+')
+# Look for patterns like "John Doe", "Mr. Smith", etc.
+_NAME_RE = re.compile(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\b')
+
+# Date formats recognised by the fallback extractor, combined into one pass
+_DATE_RE = re.compile(
+    r'\b\d{1,2}[/-]\d{1,2}[/-]\d{2,4}\b'  # MM/DD/YYYY or DD/MM/YYYY
+    r'|\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b'  # Month Day, Year
+    r'|\b\d{4}-\d{2}-\d{2}\b',  # YYYY-MM-DD
+    re.IGNORECASE
+)
+
+# Aho-Corasick automaton finds every keyword in a single pass over the text
+try:
+    import ahocorasick
+    _LEGAL_KEYWORD_AUTOMATON = ahocorasick.Automaton()
+    for _keyword in LEGAL_KEYWORDS:
+        _LEGAL_KEYWORD_AUTOMATON.add_word(_keyword, _keyword)
+    _LEGAL_KEYWORD_AUTOMATON.make_automaton()
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+    _LEGAL_KEYWORD_RE = re.compile("|".join(re.escape(k) for k in LEGAL_KEYWORDS))
+    print("Warning: pyahocorasick not available (optional, using regex keyword scan)")
+
+def _find_legal_keywords(text_lower: str) -> set:
+    """Return the set of legal keywords occurring in already-lowercased text"""
+    if AHOCORASICK_AVAILABLE:
+        return {keyword for _, keyword in _LEGAL_KEYWORD_AUTOMATON.iter(text_lower)}
+    return set(_LEGAL_KEYWORD_RE.findall(text_lower))
+
 # Try to import InLegalBERT helper
 try:
-    from inlegalbert_helper import analyze_with_inlegalbert, initialize_models as init_inlegalbert
+    from inlegalbert_helper import analyze_with_inlegalbert_batch, warmup_models as warmup_inlegalbert
     INLEGALBERT_AVAILABLE = True
-    # Initialize models on import
-    init_inlegalbert()
 except ImportError:
     INLEGALBERT_AVAILABLE = False
     print("Warning: InLegalBERT helper not available. Install transformers, torch, and faiss-cpu for precedent search.")
-except Exception as e:
-    INLEGALBERT_AVAILABLE = False
-    print(f"Warning: InLegalBERT initialization failed: {e}")
+
+# Cache of LLM analyses for repeat documents
+try:
+    import analysis_cache
+    ANALYSIS_CACHE_AVAILABLE = True
+except ImportError:
+    ANALYSIS_CACHE_AVAILABLE = False
+    print("Warning: analysis cache not available. Install cachetools to enable it.")
 
 class CaseAnalysisRequest(BaseModel):
     case_id: Optional[str] = None
 
+# Models load in the background after startup; requests needing them wait on this
+_inlegalbert_ready = asyncio.Event()
+_inlegalbert_load_task: Optional[asyncio.Task] = None
+
+async def _load_inlegalbert():
+    """Load and warm up InLegalBERT models off the event loop"""
+    try:
+        await asyncio.to_thread(warmup_inlegalbert)
+    except Exception as e:
+        print(f"Warning: InLegalBERT initialization failed: {e}")
+    finally:
+        _inlegalbert_ready.set()
+
+@app.on_event("startup")
+async def start_inlegalbert_load():
+    """Start loading InLegalBERT without holding up server startup"""
+    global _inlegalbert_load_task
+    if INLEGALBERT_AVAILABLE:
+        _inlegalbert_load_task = asyncio.create_task(_load_inlegalbert())
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    """Close pooled OpenAI connections"""
+    if client is not None:
+        await client.close()
+
+@app.on_event("shutdown")
+async def save_analysis_cache():
+    """Persist the analysis cache so it survives restarts"""
+    if ANALYSIS_CACHE_AVAILABLE:
+        analysis_cache.save_cache()
+
 @app.get("/health")
 async def health():
     return {
@@ -96,57 +224,165 @@ async def health():
         "openai_enabled": bool(OPENAI_API_KEY) and OPENAI_AVAILABLE,
         "pdf_available": PDF_AVAILABLE,
         "docx_available": DOCX_AVAILABLE,
-        "inlegalbert_enabled": INLEGALBERT_AVAILABLE
+        "inlegalbert_enabled": INLEGALBERT_AVAILABLE,
+        "inlegalbert_ready": _inlegalbert_ready.is_set()
     }
 
-async def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF file"""
+# PDFs with at least this many pages are split across worker processes
+PDF_PARALLEL_MIN_PAGES = 16
+# Capped, since every agent on the machine may run its own pool
+PDF_WORKERS = min(os.cpu_count() or 1, 4)
+_PDF_POOL: Optional[ProcessPoolExecutor] = None
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """
+    Create the shared PDF worker pool on first use. Workers are started by a
+    forkserver (spawn where unavailable), never forked from this process with
+    its torch/OpenMP threads, event loop and HTTP pool.
+    """
+    global _PDF_POOL
+    if _PDF_POOL is None:
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            context.set_forkserver_preload(["pdf_pages"])
+        _PDF_POOL = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context)
+    return _PDF_POOL
+
+@app.on_event("shutdown")
+async def shutdown_pdf_pool():
+    """Stop PDF worker processes"""
+    if _PDF_POOL is not None:
+        _PDF_POOL.shutdown(wait=False, cancel_futures=True)
+
+def _read_stream(stream: BinaryIO) -> bytes:
+    """Read a whole seekable stream from the start"""
+    stream.seek(0)
+    return stream.read()
+
+def _open_pdf(pdf_stream: BinaryIO):
+    """Parse a PDF and return (reader, page_count)"""
+    pdf_reader = PyPDF2.PdfReader(pdf_stream)
+    return pdf_reader, len(pdf_reader.pages)
+
+class ExtractionError(Exception):
+    """Text extraction failed; result is returned in place of the extracted text (and never cached)"""
+    
+    def __init__(self, result):
+        super().__init__(result)
+        self.result = result
+
+async def extract_text_from_pdf(pdf_stream: BinaryIO) -> Tuple[str, int]:
+    """
+    Extract text and page count from a seekable PDF stream without blocking the event loop.
+    Raises ExtractionError carrying a (message, page count) result on failure.
+    """
     if not PDF_AVAILABLE:
         print("WARNING: PDF processing not available. Install PyPDF2.")
-        return "PDF processing not available. Install PyPDF2."
+        raise ExtractionError(("PDF processing not available. Install PyPDF2.", 0))
     
+    page_count = 0
     try:
-        pdf_file = io.BytesIO(file_content)
-        pdf_reader = PyPDF2.PdfReader(pdf_file)
-        text = ""
-        page_count = len(pdf_reader.pages)
+        pdf_reader, page_count = await asyncio.to_thread(_open_pdf, pdf_stream)
         print(f"Extracting text from PDF with {page_count} pages...")
         
-        for i, page in enumerate(pdf_reader.pages):
-            try:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            except Exception as e:
-                print(f"Warning: Error extracting page {i+1}: {e}")
-                continue
+        if page_count >= PDF_PARALLEL_MIN_PAGES:
+            # Pages are independent: extract contiguous page ranges in parallel processes
+            file_content = await asyncio.to_thread(_read_stream, pdf_stream)
+            pool = _get_pdf_pool()
+            chunk_size = -(-page_count // PDF_WORKERS)
+            loop = asyncio.get_running_loop()
+            chunks = await asyncio.gather(*(
+                loop.run_in_executor(pool, extract_pdf_pages, file_content, start, min(start + chunk_size, page_count))
+                for start in range(0, page_count, chunk_size)
+            ))
+            page_texts = [page_text for chunk in chunks for page_text in chunk]
+        else:
+            page_texts = await asyncio.to_thread(
+                lambda: [extract_page_text(pdf_reader, i) for i in range(page_count)]
+            )
         
-        extracted_text = text.strip()
+        extracted_text = "\n".join(page_text for page_text in page_texts if page_text).strip()
         print(f"Extracted {len(extracted_text)} characters from PDF")
         
         if len(extracted_text) < 10:
             print("WARNING: Very little text extracted from PDF. It may be scanned/image-based.")
-            return f"PDF extracted but minimal text found ({len(extracted_text)} chars). PDF may be image-based and require OCR."
+            raise ExtractionError((f"PDF extracted but minimal text found ({len(extracted_text)} chars). PDF may be image-based and require OCR.", page_count))
         
-        return extracted_text
+        return extracted_text, page_count
+    except ExtractionError:
+        raise
     except Exception as e:
         print(f"Error extracting PDF text: {str(e)}")
         import traceback
         traceback.print_exc()
-        return f"Error extracting PDF text: {str(e)}"
+        raise ExtractionError((f"Error extracting PDF text: {str(e)}", page_count))
+
+def _hash_stream(stream: BinaryIO) -> str:
+    """SHA-256 of a seekable stream, read in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(1 << 20), b""):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+async def extract_with_cache(stream: BinaryIO, kind: str, extract):
+    """
+    Run an async extractor on a stream, reusing the stored result for identical content.
+    Only successful extractions are stored; an ExtractionError's result is returned as is,
+    so a transient failure or missing dependency is retried on the next upload.
+    """
+    key = None
+    if TEXT_CACHE_AVAILABLE:
+        key = f"{kind}:{await asyncio.to_thread(_hash_stream, stream)}"
+        cached = await asyncio.to_thread(_TEXT_CACHE.get, key)
+        if cached is not None:
+            print(f"Using cached {kind} text extraction")
+            return cached
+    
+    try:
+        extracted = await extract(stream)
+    except ExtractionError as e:
+        return e.result
+    if key is not None:
+        await asyncio.to_thread(_TEXT_CACHE.set, key, extracted)
+    return extracted
 
-async def extract_text_from_docx(file_content: bytes) -> str:
-    """Extract text from DOCX file"""
+def _sync_extract_docx(docx_stream: BinaryIO) -> str:
+    """Extract text from a DOCX stream (blocking, run via extract_text_from_docx)"""
     if not DOCX_AVAILABLE:
-        return "DOCX processing not available. Install python-docx."
+        raise ExtractionError("DOCX processing not available. Install python-docx.")
     
     try:
-        docx_file = io.BytesIO(file_content)
-        doc = Document(docx_file)
+        doc = Document(docx_stream)
         text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
         return text.strip()
     except Exception as e:
-        return f"Error extracting DOCX text: {str(e)}"
+        raise ExtractionError(f"Error extracting DOCX text: {str(e)}")
+
+async def extract_text_from_docx(docx_stream: BinaryIO) -> str:
+    """Extract text from a DOCX stream without blocking the event loop; raises ExtractionError on failure"""
+    return await asyncio.to_thread(_sync_extract_docx, docx_stream)
+
+# Vision uploads are downscaled to this long edge and re-encoded as JPEG
+VISION_MAX_EDGE = 1536
+VISION_JPEG_QUALITY = 85
+
+def _shrink_image(image_content: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """Downscale and JPEG-encode an image for the Vision API, keeping the original if that is smaller"""
+    if not PILLOW_AVAILABLE:
+        return image_content, mime_type
+    try:
+        img = Image.open(io.BytesIO(image_content))
+        img.thumbnail((VISION_MAX_EDGE, VISION_MAX_EDGE))
+        buf = io.BytesIO()
+        img.convert("RGB").save(buf, "JPEG", quality=VISION_JPEG_QUALITY, optimize=True)
+        if buf.tell() < len(image_content):
+            return buf.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"Image downscaling failed, sending original: {e}")
+    return image_content, mime_type
 
 async def analyze_image_with_openai(image_content: bytes, mime_type: str) -> dict:
     """Analyze image using OpenAI Vision API and extract structured legal information"""
@@ -154,16 +390,25 @@ async def analyze_image_with_openai(image_content: bytes, mime_type: str) -> dic
         print("OpenAI API not available for image analysis")
         return {"error": "OpenAI API not available"}
     
+    # Identical re-uploads skip the Vision call entirely
+    if ANALYSIS_CACHE_AVAILABLE:
+        cached = analysis_cache.lookup_image(image_content)
+        if cached is not None:
+            print("Using cached analysis for image")
+            return cached
+    
     try:
+        # Shrink large photos before upload; vision tokens scale with image size
+        upload_content, upload_type = await asyncio.to_thread(_shrink_image, image_content, mime_type)
+
         # Convert image to base64 for OpenAI
-        import base64
-        image_base64 = base64.b64encode(image_content).decode('utf-8')
+        image_base64 = base64.b64encode(upload_content).decode('utf-8')
         
         # Determine image format
-        image_format = "png" if "png" in mime_type else "jpeg"
+        image_format = "png" if "png" in upload_type else "jpeg"
         image_url = f"data:image/{image_format};base64,{image_base64}"
         
-        print(f"Analyzing image with OpenAI Vision API (size: {len(image_content)} bytes)")
+        print(f"Analyzing image with OpenAI Vision API (size: {len(upload_content)} bytes, original {len(image_content)} bytes)")
         
         prompt = """You are a legal document analyst. Analyze this image and extract ALL relevant legal information in JSON format.
 
@@ -199,7 +444,7 @@ CRITICAL REQUIREMENTS:
 
 Return ONLY valid JSON:"""
         
-        response = client.chat.completions.create(
+        response = await create_chat_completion(
             model="gpt-4o-mini",  # Using vision-capable model
             messages=[
                 {"role": "system", "content": "You are a legal document analyst. Always return valid JSON."},
@@ -221,17 +466,11 @@ Return ONLY valid JSON:"""
         # Try to parse JSON from response
         try:
             # Extract JSON if wrapped in markdown
-            if "```json" in analysis_text:
-                json_start = analysis_text.find("```json") + 7
-                json_end = analysis_text.find("```", json_start)
-                analysis_text = analysis_text[json_start:json_end].strip()
-            elif "```" in analysis_text:
-                json_start = analysis_text.find("```") + 3
-                json_end = analysis_text.find("```", json_start)
-                analysis_text = analysis_text[json_start:json_end].strip()
-            
-            analysis = json.loads(analysis_text)
+            analysis_text = strip_json_fence(analysis_text)
+            analysis = json_loads(analysis_text)
             print(f"Successfully extracted from image: {len(analysis.get('key_facts', []))} facts, {len(analysis.get('legal_issues', []))} issues")
+            if ANALYSIS_CACHE_AVAILABLE:
+                analysis_cache.store_image(image_content, analysis)
             return analysis
         except json.JSONDecodeError as e:
             print(f"JSON parsing error for image: {e}")
@@ -259,30 +498,20 @@ async def extract_basic_info_from_text(text: str, file_type: str) -> dict:
     legal_issues = []
     
     # Extract sentences as potential facts (first 20 sentences)
-    sentences = re.split(r'[.!?]+', text)
+    sentences = _SENT_RE.split(text)
     for sentence in sentences[:20]:
         sentence = sentence.strip()
         if len(sentence) > 20 and len(sentence) < 300:
             key_facts.append(sentence)
     
     # Extract potential names (capitalized words that might be names)
-    # Look for patterns like "John Doe", "Mr. Smith", etc.
-    name_pattern = r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+)+)\b'
-    potential_names = re.findall(name_pattern, text)
+    potential_names = _NAME_RE.findall(text)
     for name in set(potential_names[:10]):
         if len(name.split()) <= 3:  # Reasonable name length
             entities["people"].append({"name": name, "role": "mentioned in document"})
     
     # Extract dates (various formats)
-    date_patterns = [
-        r'\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})\b',  # MM/DD/YYYY or DD/MM/YYYY
-        r'\b(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b',  # Month Day, Year
-        r'\b\d{4}-\d{2}-\d{2}\b'  # YYYY-MM-DD
-    ]
-    
-    dates_found = []
-    for pattern in date_patterns:
-        dates_found.extend(re.findall(pattern, text, re.IGNORECASE))
+    dates_found = _DATE_RE.findall(text)
     
     # Create timeline entries from dates found
     for i, date in enumerate(set(dates_found[:10])):
@@ -294,22 +523,22 @@ async def extract_basic_info_from_text(text: str, file_type: str) -> dict:
         })
     
     # Extract potential legal issues (look for keywords)
-    legal_keywords = ['violation', 'breach', 'crime', 'illegal', 'fraud', 'negligence', 
-                      'contract', 'lawsuit', 'liability', 'damages', 'evidence', 'witness',
-                      'testimony', 'allegation', 'charge', 'conviction', 'sentence']
-    
-    sentences_lower = text.lower()
-    for keyword in legal_keywords:
-        if keyword in sentences_lower:
-            # Find the sentence containing the keyword
-            for sentence in sentences:
-                if keyword.lower() in sentence.lower() and len(sentence) > 30:
-                    legal_issues.append({
-                        "issue": f"Potential {keyword} issue identified",
-                        "severity": "medium",
-                        "description": sentence[:200]
-                    })
-                    break
+    # One keyword sweep per sentence, remembering the first sentence for each hit
+    keyword_sentences = {}
+    for sentence in sentences:
+        if len(sentence) > 30:
+            for keyword in _find_legal_keywords(sentence.lower()):
+                keyword_sentences.setdefault(keyword, sentence)
+            if len(keyword_sentences) == len(LEGAL_KEYWORDS):
+                break
+    
+    for keyword in LEGAL_KEYWORDS:
+        if keyword in keyword_sentences:
+            legal_issues.append({
+                "issue": f"Potential {keyword} issue identified",
+                "severity": "medium",
+                "description": keyword_sentences[keyword][:200]
+            })
     
     # Generate summary from first few sentences
     summary = " ".join(sentences[:3])[:300] if sentences else f"Document processed: {file_type}"
@@ -322,21 +551,95 @@ async def extract_basic_info_from_text(text: str, file_type: str) -> dict:
         "summary": summary
     }
 
-async def analyze_text_with_openai(text: str, file_type: str) -> dict:
-    """Analyze text content using OpenAI for legal extraction"""
-    if not OPENAI_AVAILABLE or not client:
-        print("OpenAI API not available for text analysis, using fallback extraction")
-        # Use fallback extraction when OpenAI is not available
-        fallback_result = await extract_basic_info_from_text(text, file_type)
-        fallback_result["error"] = "OpenAI API not available"
-        fallback_result["fallback_used"] = True
-        return fallback_result
-    
-    try:
-        # Limit text to avoid token limits (keep it reasonable)
-        text_sample = text[:12000] if len(text) > 12000 else text
-        
-        prompt = f"""You are a legal document analyst. Analyze this document and extract ALL relevant legal information.
+# Cases that opt in (use_batch_api) and have at least this many documents to
+# analyze go through the OpenAI Batch API: cheaper, but the request waits for the batch
+BATCH_API_MIN_FILES = 5
+BATCH_API_MAX_WAIT = 15 * 60  # seconds to wait for a batch before falling back to direct calls
+TEXT_ANALYSIS_MODEL = "gpt-3.5-turbo"
+
+# Document token budget: 16k context minus the prompt template and max_tokens=2000 reply
+MAX_DOCUMENT_TOKENS = 13000
+MAX_DOCUMENT_CHARS = 12000  # used when tiktoken is not installed
+
+try:
+    import tiktoken
+    _TOKEN_ENCODING = tiktoken.encoding_for_model(TEXT_ANALYSIS_MODEL)
+    TIKTOKEN_AVAILABLE = True
+except Exception:
+    _TOKEN_ENCODING = None
+    TIKTOKEN_AVAILABLE = False
+    print("Warning: tiktoken not available (optional, truncating documents by characters)")
+
+def truncate_document(text: str) -> str:
+    """Trim document text to the prompt token budget"""
+    if not TIKTOKEN_AVAILABLE:
+        return text[:MAX_DOCUMENT_CHARS]
+    tokens = _TOKEN_ENCODING.encode(text, disallowed_special=())
+    if len(tokens) <= MAX_DOCUMENT_TOKENS:
+        return text
+    return _TOKEN_ENCODING.decode(tokens[:MAX_DOCUMENT_TOKENS])
+
+# Client-side OpenAI throttling: at most OPENAI_MAX_CONCURRENCY requests in
+# flight and a token bucket refilled at OPENAI_TPM_LIMIT tokens per minute
+OPENAI_MAX_CONCURRENCY = 20
+OPENAI_TPM_LIMIT = 200000
+OPENAI_RATE_LIMIT_RETRIES = 5
+IMAGE_TOKEN_ESTIMATE = 1000  # rough vision cost of one downscaled image
+
+_openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+_bucket_lock = asyncio.Lock()
+_bucket_tokens = float(OPENAI_TPM_LIMIT)
+_bucket_refilled_at = time.monotonic()
+
+def _estimate_request_tokens(messages: List[dict], max_tokens: int) -> int:
+    """Estimate prompt plus completion tokens for a chat request"""
+    tokens = max_tokens
+    for message in messages:
+        content = message["content"]
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content}]
+        for part in parts:
+            if part.get("type") == "text":
+                text = part["text"]
+                tokens += len(_TOKEN_ENCODING.encode(text, disallowed_special=())) if TIKTOKEN_AVAILABLE else len(text) // 4
+            else:
+                tokens += IMAGE_TOKEN_ESTIMATE
+    return tokens
+
+async def _acquire_tokens(amount: int):
+    """Wait until the token bucket holds amount tokens, then take them"""
+    global _bucket_tokens, _bucket_refilled_at
+    amount = min(amount, OPENAI_TPM_LIMIT)
+    async with _bucket_lock:
+        while True:
+            now = time.monotonic()
+            _bucket_tokens = min(OPENAI_TPM_LIMIT, _bucket_tokens + (now - _bucket_refilled_at) * OPENAI_TPM_LIMIT / 60)
+            _bucket_refilled_at = now
+            if _bucket_tokens >= amount:
+                _bucket_tokens -= amount
+                return
+            await asyncio.sleep((amount - _bucket_tokens) * 60 / OPENAI_TPM_LIMIT)
+
+async def create_chat_completion(**kwargs):
+    """
+    Rate-limited client.chat.completions.create.
+    Throttles concurrency and token spend, and retries 429s with exponential backoff.
+    """
+    estimated_tokens = _estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens", 0))
+    for attempt in range(OPENAI_RATE_LIMIT_RETRIES + 1):
+        async with _openai_semaphore:
+            await _acquire_tokens(estimated_tokens)
+            try:
+                return await client.chat.completions.create(**kwargs)
+            except RateLimitError:
+                if attempt == OPENAI_RATE_LIMIT_RETRIES:
+                    raise
+        delay = 2 ** attempt + random.random()
+        print(f"OpenAI rate limit hit, retrying in {delay:.1f}s (attempt {attempt + 1}/{OPENAI_RATE_LIMIT_RETRIES})")
+        await asyncio.sleep(delay)
+
+def _text_analysis_messages(text_sample: str) -> List[dict]:
+    """Build the chat messages for legal extraction from a document sample"""
+    prompt = f"""You are a legal document analyst. Analyze this document and extract ALL relevant legal information.
 
 DOCUMENT CONTENT:
 {text_sample}
@@ -370,49 +673,74 @@ CRITICAL REQUIREMENTS:
 6. Return ONLY the JSON, no other text
 
 Return ONLY valid JSON:"""
+    
+    return [
+        {"role": "system", "content": "You are a legal document analyst. Always return valid JSON."},
+        {"role": "user", "content": prompt}
+    ]
+
+def _lookup_cached_text_analysis(text_sample: str) -> Optional[dict]:
+    """Return the cached analysis of a document, or None"""
+    if ANALYSIS_CACHE_AVAILABLE:
+        cached = analysis_cache.lookup(text_sample)
+        if cached is not None:
+            print("Using cached analysis for document")
+            return cached
+    return None
+
+async def _parse_text_analysis(response_text: str, text: str, file_type: str, text_sample: str) -> dict:
+    """Parse an OpenAI text analysis response, falling back to basic extraction on bad JSON"""
+    print(f"OpenAI response length: {len(response_text)} chars")
+    
+    # Clean JSON response
+    response_text = strip_json_fence(response_text)
+    
+    # Parse JSON
+    try:
+        extracted = json_loads(response_text)
+        print(f"Successfully extracted: {len(extracted.get('key_facts', []))} facts, {len(extracted.get('legal_issues', []))} issues")
+        if ANALYSIS_CACHE_AVAILABLE:
+            analysis_cache.store(text_sample, extracted)
+        return extracted
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {e}")
+        print(f"Response preview: {response_text[:300]}")
+        print("Falling back to basic text extraction...")
+        
+        # Use fallback extraction when JSON parsing fails
+        fallback_result = await extract_basic_info_from_text(text, file_type)
+        fallback_result["json_parse_error"] = True
+        fallback_result["openai_response"] = response_text[:500]
+        return fallback_result
+
+async def analyze_text_with_openai(text: str, file_type: str) -> dict:
+    """Analyze text content using OpenAI for legal extraction"""
+    if not OPENAI_AVAILABLE or not client:
+        print("OpenAI API not available for text analysis, using fallback extraction")
+        # Use fallback extraction when OpenAI is not available
+        fallback_result = await extract_basic_info_from_text(text, file_type)
+        fallback_result["error"] = "OpenAI API not available"
+        fallback_result["fallback_used"] = True
+        return fallback_result
+    
+    try:
+        # Limit text to avoid token limits
+        text_sample = truncate_document(text)
+        
+        # Serve repeat documents from the analysis cache
+        cached = _lookup_cached_text_analysis(text_sample)
+        if cached is not None:
+            return cached
         
         print(f"Calling OpenAI API for text analysis (text length: {len(text)} chars)")
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a legal document analyst. Always return valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
+        response = await create_chat_completion(
+            model=TEXT_ANALYSIS_MODEL,
+            messages=_text_analysis_messages(text_sample),
             temperature=0.3,
             max_tokens=2000
         )
         response_text = response.choices[0].message.content.strip()
-        
-        print(f"OpenAI response length: {len(response_text)} chars")
-        
-        # Clean JSON response
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        
-        # Remove any leading/trailing whitespace
-        response_text = response_text.strip()
-        
-        # Parse JSON
-        try:
-            extracted = json.loads(response_text)
-            print(f"Successfully extracted: {len(extracted.get('key_facts', []))} facts, {len(extracted.get('legal_issues', []))} issues")
-            return extracted
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Response preview: {response_text[:300]}")
-            print("Falling back to basic text extraction...")
-            
-            # Use fallback extraction when JSON parsing fails
-            fallback_result = await extract_basic_info_from_text(text, file_type)
-            fallback_result["json_parse_error"] = True
-            fallback_result["openai_response"] = response_text[:500]
-            return fallback_result
+        return await _parse_text_analysis(response_text, text, file_type, text_sample)
     except Exception as e:
         print(f"OpenAI analysis error: {str(e)}")
         import traceback
@@ -425,44 +753,187 @@ Return ONLY valid JSON:"""
         fallback_result["fallback_used"] = True
         return fallback_result
 
+async def _run_openai_batch(requests: Dict[str, List[dict]]) -> Dict[str, str]:
+    """
+    Submit chat completion requests as one OpenAI Batch API job and wait for it.
+    Maps each custom_id to its response text; raises if the job fails or times out.
+    """
+    lines = [
+        json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": TEXT_ANALYSIS_MODEL, "messages": messages, "temperature": 0.3, "max_tokens": 2000}
+        }, ensure_ascii=False)
+        for custom_id, messages in requests.items()
+    ]
+    batch_file = await client.files.create(
+        file=("analysis_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted OpenAI batch {batch.id} with {len(lines)} requests")
+    
+    # Poll with exponential backoff
+    delay, waited = 2, 0
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        if waited >= BATCH_API_MAX_WAIT:
+            await client.batches.cancel(batch.id)
+            raise TimeoutError(f"Batch {batch.id} not finished after {waited}s")
+        await asyncio.sleep(delay)
+        waited += delay
+        delay = min(delay * 2, 60)
+        batch = await client.batches.retrieve(batch.id)
+    
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+    
+    output = await client.files.content(batch.output_file_id)
+    responses = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        record = json_loads(line)
+        choices = ((record.get("response") or {}).get("body") or {}).get("choices") or []
+        if choices and choices[0].get("message", {}).get("content"):
+            responses[record["custom_id"]] = choices[0]["message"]["content"].strip()
+    return responses
+
+async def analyze_text_with_openai_batch(texts: List[str], file_types: List[str]) -> List[dict]:
+    """
+    Analyze several documents through one OpenAI Batch API job (cheaper, separate rate limits).
+    Cached documents are skipped; requests missing from the batch output, or the whole
+    batch if it cannot be completed, fall back to direct analyze_text_with_openai calls.
+    """
+    if not OPENAI_AVAILABLE or not client:
+        return list(await asyncio.gather(*(analyze_text_with_openai(t, ft) for t, ft in zip(texts, file_types))))
+    
+    text_samples = [truncate_document(text) for text in texts]
+    results: List[Optional[dict]] = [_lookup_cached_text_analysis(text_sample) for text_sample in text_samples]
+    
+    pending = [i for i, result in enumerate(results) if result is None]
+    responses = {}
+    if pending:
+        try:
+            responses = await _run_openai_batch({str(i): _text_analysis_messages(text_samples[i]) for i in pending})
+        except Exception as e:
+            print(f"OpenAI Batch API failed ({e}), using direct calls")
+    
+    async def finish(i: int) -> dict:
+        if str(i) in responses:
+            return await _parse_text_analysis(responses[str(i)], texts[i], file_types[i], text_samples[i])
+        return await analyze_text_with_openai(texts[i], file_types[i])
+    
+    for i, analysis in zip(pending, await asyncio.gather(*(finish(i) for i in pending))):
+        results[i] = analysis
+    return results
+
+async def run_inlegalbert_analysis(file_results: List[dict], texts: List[str]):
+    """Run batched InLegalBERT NER + precedent search and attach it to each file result"""
+    if not INLEGALBERT_AVAILABLE or not file_results:
+        return
+    
+    if _inlegalbert_load_task is not None:
+        await _inlegalbert_ready.wait()
+    
+    try:
+        print(f"Running InLegalBERT analysis (NER + precedent search) on {len(texts)} file(s)...")
+        batch_results = await asyncio.to_thread(analyze_with_inlegalbert_batch, texts, 5)
+        for result, inlegalbert_result in zip(file_results, batch_results):
+            if inlegalbert_result.get("inlegalbert_available"):
+                result["inlegalbert_analysis"] = {
+                    "ner": inlegalbert_result.get("ner", []),
+                    "precedents": inlegalbert_result.get("precedents", []),
+                    "embedding_dim": inlegalbert_result.get("embedding_dim", 0),
+                    "precedents_found": len(inlegalbert_result.get("precedents", []))
+                }
+                print(f"✅ InLegalBERT: Found {len(inlegalbert_result.get('precedents', []))} precedents, {len(inlegalbert_result.get('ner', []))} NER tokens for {result['file_name']}")
+            else:
+                result["inlegalbert_analysis"] = {
+                    "error": "InLegalBERT models not available",
+                    "ner": [],
+                    "precedents": []
+                }
+    except Exception as e:
+        print(f"⚠️ InLegalBERT analysis failed: {e}")
+        for result in file_results:
+            result["inlegalbert_analysis"] = {
+                "error": str(e),
+                "ner": [],
+                "precedents": []
+            }
+
 async def process_file(file: UploadFile, case_id: str) -> dict:
     """Process a single uploaded file"""
-    content = await file.read()
+    result, inlegalbert_text = await extract_and_analyze_file(file, case_id)
+    if inlegalbert_text:
+        await run_inlegalbert_analysis([result], [inlegalbert_text])
+    return result
+
+async def extract_and_analyze_file(file: UploadFile, case_id: str) -> Tuple[dict, str]:
+    """
+    Extract and analyze a single uploaded file.
+    Returns the file result and the text to run InLegalBERT on ("" if none),
+    so callers can batch the InLegalBERT pass across files.
+    """
+    result, extracted_text = await extract_file_content(file)
+    analysis = None
+    if needs_text_analysis(result, extracted_text):
+        print(f"Analyzing {len(extracted_text)} chars of text with OpenAI...")
+        analysis = await analyze_text_with_openai(extracted_text, result["file_type"])
+    return result, finish_file_result(result, extracted_text, analysis)
+
+def _upload_size(file: UploadFile) -> int:
+    """Size of an uploaded file without reading it into memory"""
+    if file.size is not None:
+        return file.size
+    position = file.file.tell()
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(position)
+    return size
+
+async def extract_file_content(file: UploadFile) -> Tuple[dict, str]:
+    """Read an uploaded file and extract its text (images are analyzed with Vision here)"""
     file_type = file.content_type or "application/octet-stream"
     file_name = file.filename or "unknown"
+    file_size = _upload_size(file)
     
-    print(f"Processing file: {file_name}, type: {file_type}, size: {len(content)} bytes")
+    print(f"Processing file: {file_name}, type: {file_type}, size: {file_size} bytes")
     
     result = {
         "file_name": file_name,
         "file_type": file_type,
-        "file_size": len(content),
+        "file_size": file_size,
         "processed": False
     }
     
     extracted_text = ""
     
-    # Process based on file type
+    # PDF and DOCX parsers read straight from the spooled upload file;
+    # other types are small or need the full buffer, so read them into memory
     if file_type == "application/pdf":
-        extracted_text = await extract_text_from_pdf(content)
-        try:
-            if PDF_AVAILABLE:
-                pdf_file = io.BytesIO(content)
-                pdf_reader = PyPDF2.PdfReader(pdf_file)
-                result["pages"] = len(pdf_reader.pages)
-            else:
-                result["pages"] = 0
-        except:
-            result["pages"] = 0
+        await file.seek(0)
+        extracted_text, result["pages"] = await extract_with_cache(file.file, "pdf", extract_text_from_pdf)
         result["type"] = "pdf"
         print(f"PDF extraction result: {len(extracted_text)} chars extracted")
-        
-    elif file_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document", 
-                       "application/msword"]:
-        extracted_text = await extract_text_from_docx(content)
+        return result, extracted_text
+    
+    if file_type in ["application/vnd.openxmlformats-officedocument.wordprocessingml.document", 
+                     "application/msword"]:
+        await file.seek(0)
+        extracted_text = await extract_with_cache(file.file, "docx", extract_text_from_docx)
         result["type"] = "document"
-        
-    elif file_type.startswith("text/"):
+        return result, extracted_text
+    
+    content = await file.read()
+    
+    # Process based on file type
+    if file_type.startswith("text/"):
         try:
             extracted_text = content.decode('utf-8')
         except:
@@ -514,10 +985,22 @@ async def process_file(file: UploadFile, case_id: str) -> dict:
             extracted_text = f"Unsupported file type: {file_type}"
         result["type"] = "unknown"
     
-    # Analyze extracted text with OpenAI (skip if already processed from image)
-    if not result.get("processed", False) and extracted_text and len(extracted_text.strip()) > 10:
-        print(f"Analyzing {len(extracted_text)} chars of text with OpenAI...")
-        analysis = await analyze_text_with_openai(extracted_text, file_type)
+    return result, extracted_text
+
+def needs_text_analysis(result: dict, extracted_text: str) -> bool:
+    """Whether extracted text should be analyzed with OpenAI (skip if already processed from image)"""
+    return bool(not result.get("processed", False) and extracted_text and len(extracted_text.strip()) > 10)
+
+def finish_file_result(result: dict, extracted_text: str, analysis: Optional[dict]) -> str:
+    """
+    Attach the text analysis (or a placeholder) to a file result.
+    Returns the text to run InLegalBERT on ("" if none).
+    """
+    file_name = result["file_name"]
+    file_type = result["file_type"]
+    inlegalbert_text = ""
+    
+    if analysis is not None:
         result["analysis"] = analysis
         result["extracted_text_preview"] = extracted_text[:500]
         result["processed"] = True
@@ -539,32 +1022,9 @@ async def process_file(file: UploadFile, case_id: str) -> dict:
             print(f"WARNING: Analysis missing 'summary', adding fallback")
             analysis["summary"] = f"Document processed: {file_name}"
         
-        # Run InLegalBERT analysis for NER and precedent retrieval
-        if INLEGALBERT_AVAILABLE and extracted_text:
-            try:
-                print(f"Running InLegalBERT analysis (NER + precedent search)...")
-                inlegalbert_result = analyze_with_inlegalbert(extracted_text, top_k_precedents=5)
-                if inlegalbert_result.get("inlegalbert_available"):
-                    result["inlegalbert_analysis"] = {
-                        "ner": inlegalbert_result.get("ner", []),
-                        "precedents": inlegalbert_result.get("precedents", []),
-                        "embedding_dim": inlegalbert_result.get("embedding_dim", 0),
-                        "precedents_found": len(inlegalbert_result.get("precedents", []))
-                    }
-                    print(f"✅ InLegalBERT: Found {len(inlegalbert_result.get('precedents', []))} precedents, {len(inlegalbert_result.get('ner', []))} NER tokens")
-                else:
-                    result["inlegalbert_analysis"] = {
-                        "error": "InLegalBERT models not available",
-                        "ner": [],
-                        "precedents": []
-                    }
-            except Exception as e:
-                print(f"⚠️ InLegalBERT analysis failed: {e}")
-                result["inlegalbert_analysis"] = {
-                    "error": str(e),
-                    "ner": [],
-                    "precedents": []
-                }
+        # InLegalBERT NER and precedent retrieval is batched by the caller
+        if INLEGALBERT_AVAILABLE:
+            inlegalbert_text = extracted_text
             
     elif not result.get("processed", False):
         print(f"WARNING: Insufficient text extracted ({len(extracted_text) if extracted_text else 0} chars)")
@@ -577,14 +1037,87 @@ async def process_file(file: UploadFile, case_id: str) -> dict:
         }
         result["processed"] = True
     
-    return result
+    return inlegalbert_text
+
+async def extract_and_analyze_files_batched(files: List[UploadFile]) -> list:
+    """
+    Extract all files concurrently, then analyze their text in one OpenAI batch.
+    Returns (result, inlegalbert_text) or an exception per file, like asyncio.gather.
+    """
+    extracted = await asyncio.gather(*(extract_file_content(file) for file in files), return_exceptions=True)
+    pending = [
+        i for i, outcome in enumerate(extracted)
+        if not isinstance(outcome, BaseException) and needs_text_analysis(*outcome)
+    ]
+    
+    analyses = {}
+    if len(pending) >= BATCH_API_MIN_FILES:
+        print(f"Analyzing {len(pending)} documents with the OpenAI Batch API...")
+        batch = await analyze_text_with_openai_batch(
+            [extracted[i][1] for i in pending],
+            [extracted[i][0]["file_type"] for i in pending]
+        )
+        analyses = dict(zip(pending, batch))
+    elif pending:
+        direct = await asyncio.gather(*(
+            analyze_text_with_openai(extracted[i][1], extracted[i][0]["file_type"]) for i in pending
+        ))
+        analyses = dict(zip(pending, direct))
+    
+    outcomes = []
+    for i, outcome in enumerate(extracted):
+        if isinstance(outcome, BaseException):
+            outcomes.append(outcome)
+            continue
+        result, extracted_text = outcome
+        try:
+            outcomes.append((result, finish_file_result(result, extracted_text, analyses.get(i))))
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes
+
+def _dedup_by_name(entries: list) -> list:
+    """Deduplicate entities by case-insensitive name, keeping the first occurrence"""
+    seen = {}
+    for entry in entries:
+        name = (entry.get("name", "") if isinstance(entry, dict) else str(entry)).lower()
+        if name:
+            seen.setdefault(name, entry)
+    return list(seen.values())
+
+ENTITY_TYPES = ("people", "organizations", "locations")
+
+def _list_field(container: dict, key: str) -> list:
+    """Return the non-empty items of a list field, or [] if it is missing or not a list"""
+    value = container.get(key)
+    return [item for item in value if item] if isinstance(value, list) else []
+
+def _aggregate_analysis(analysis: dict) -> dict:
+    """Collect the aggregatable parts of one file's analysis in a single pass"""
+    entities = analysis.get("entities")
+    if not isinstance(entities, dict):
+        entities = {}
+    summary = analysis.get("summary")
+    return {
+        "key_facts": [f for f in _list_field(analysis, "key_facts") if isinstance(f, str)],
+        "entities": {entity_type: _list_field(entities, entity_type) for entity_type in ENTITY_TYPES},
+        "timeline": _list_field(analysis, "timeline"),
+        "legal_issues": _list_field(analysis, "legal_issues"),
+        "summary": summary if isinstance(summary, str) and summary.strip() else None
+    }
 
 @app.post("/analyze")
 async def analyze_case(
     case_id: Optional[str] = Form(None),
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    use_batch_api: bool = Form(False)
 ):
-    """Analyze a case with real uploaded files"""
+    """
+    Analyze a case with real uploaded files.
+    
+    With use_batch_api, cases of BATCH_API_MIN_FILES or more files are analyzed
+    in one OpenAI Batch API job; the response can then take up to BATCH_API_MAX_WAIT.
+    """
     try:
         case_id = case_id or f"case_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
@@ -605,7 +1138,7 @@ async def analyze_case(
     # Process all files
     processed_files = []
     all_key_facts = []
-    all_entities = {"people": [], "organizations": [], "locations": []}
+    all_entities = {entity_type: [] for entity_type in ENTITY_TYPES}
     all_timeline = []
     all_legal_issues = []
     summaries = []
@@ -613,9 +1146,29 @@ async def analyze_case(
     all_precedents = []
     all_ner_tokens = []
     
-    for file in files:
+    # Process all files concurrently so extraction and OpenAI calls overlap;
+    # large cases that opt in send their text analyses as one Batch API job instead
+    if use_batch_api and len(files) >= BATCH_API_MIN_FILES:
+        outcomes = await extract_and_analyze_files_batched(files)
+    else:
+        outcomes = await asyncio.gather(
+            *(extract_and_analyze_file(file, case_id) for file in files),
+            return_exceptions=True
+        )
+    file_results = [o if isinstance(o, BaseException) else o[0] for o in outcomes]
+    
+    # One batched InLegalBERT pass over every file that produced text
+    inlegalbert_batch = [o for o in outcomes if not isinstance(o, BaseException) and o[1]]
+    if inlegalbert_batch:
+        await run_inlegalbert_analysis(
+            [file_result for file_result, _ in inlegalbert_batch],
+            [text for _, text in inlegalbert_batch]
+        )
+    
+    for file, file_result in zip(files, file_results):
         try:
-            file_result = await process_file(file, case_id)
+            if isinstance(file_result, BaseException):
+                raise file_result
             processed_files.append(file_result)
             
             # Aggregate analysis results
@@ -627,46 +1180,21 @@ async def analyze_case(
                     print(f"Warning: Analysis error for {file_result['file_name']}: {analysis.get('error', 'Unknown error')}")
                     # Still try to use what we have
                 
-                # Extract key facts
-                if "key_facts" in analysis and isinstance(analysis["key_facts"], list):
-                    facts = [f for f in analysis["key_facts"] if f and isinstance(f, str)]
-                    all_key_facts.extend(facts)
-                    print(f"Added {len(facts)} facts from {file_result['file_name']}")
-                
-                # Extract entities
-                if "entities" in analysis and isinstance(analysis["entities"], dict):
-                    for entity_type in ["people", "organizations", "locations"]:
-                        if entity_type in analysis["entities"] and isinstance(analysis["entities"][entity_type], list):
-                            entities = [e for e in analysis["entities"][entity_type] if e]
-                            all_entities[entity_type].extend(entities)
-                            print(f"Added {len(entities)} {entity_type} from {file_result['file_name']}")
-                
-                # Extract timeline
-                if "timeline" in analysis and isinstance(analysis["timeline"], list):
-                    events = [e for e in analysis["timeline"] if e]
-                    all_timeline.extend(events)
-                    print(f"Added {len(events)} timeline events from {file_result['file_name']}")
-                
-                # Extract legal issues
-                if "legal_issues" in analysis and isinstance(analysis["legal_issues"], list):
-                    issues = [i for i in analysis["legal_issues"] if i]
-                    all_legal_issues.extend(issues)
-                    print(f"Added {len(issues)} legal issues from {file_result['file_name']}")
-                
-                # Extract summary
-                if "summary" in analysis and isinstance(analysis["summary"], str) and analysis["summary"].strip():
-                    summaries.append(analysis["summary"])
-                    print(f"Added summary from {file_result['file_name']}")
+                parts = _aggregate_analysis(analysis)
+                all_key_facts.extend(parts["key_facts"])
+                for entity_type, entities in parts["entities"].items():
+                    all_entities[entity_type].extend(entities)
+                all_timeline.extend(parts["timeline"])
+                all_legal_issues.extend(parts["legal_issues"])
+                if parts["summary"]:
+                    summaries.append(parts["summary"])
             
             # Extract InLegalBERT results if available
             if "inlegalbert_analysis" in file_result:
                 inlegalbert = file_result["inlegalbert_analysis"]
-                # Aggregate precedents
-                if "precedents" in inlegalbert and isinstance(inlegalbert["precedents"], list):
+                if isinstance(inlegalbert.get("precedents"), list):
                     all_precedents.extend(inlegalbert["precedents"])
-                    print(f"Added {len(inlegalbert['precedents'])} precedents from {file_result['file_name']}")
-                # Aggregate NER tokens
-                if "ner" in inlegalbert and isinstance(inlegalbert["ner"], list):
+                if isinstance(inlegalbert.get("ner"), list):
                     all_ner_tokens.extend(inlegalbert["ner"])
             
             summaries.append(f"Processed {file_result['file_name']} ({file_result['type']})")
@@ -680,38 +1208,7 @@ async def analyze_case(
             })
     
     # Deduplicate entities
-    seen_people = {}
-    for person in all_entities["people"]:
-        if isinstance(person, dict):
-            name = person.get("name", "").lower()
-        else:
-            name = str(person).lower()
-        if name and name not in seen_people:
-            seen_people[name] = person
-    
-    seen_orgs = {}
-    for org in all_entities["organizations"]:
-        if isinstance(org, dict):
-            name = org.get("name", "").lower()
-        else:
-            name = str(org).lower()
-        if name and name not in seen_orgs:
-            seen_orgs[name] = org
-    
-    seen_locs = {}
-    for loc in all_entities["locations"]:
-        if isinstance(loc, dict):
-            name = loc.get("name", "").lower()
-        else:
-            name = str(loc).lower()
-        if name and name not in seen_locs:
-            seen_locs[name] = loc
-    
-    all_entities = {
-        "people": list(seen_people.values()),
-        "organizations": list(seen_orgs.values()),
-        "locations": list(seen_locs.values())
-    }
+    all_entities = {entity_type: _dedup_by_name(entries) for entity_type, entries in all_entities.items()}
                 
     # Generate comprehensive case summary
     case_summary = f"""
@@ -750,25 +1247,20 @@ async def analyze_case(
         }]
         print("Warning: No legal issues extracted - using fallback")
     
-    # Deduplicate precedents by case_id
+    # Deduplicate precedents by case_id (by text when there is none); the key
+    # kind is part of the key so an id can never collide with a text
     seen_precedents = {}
     for prec in all_precedents:
         case_id_prec = prec.get("case_id", "")
-        if case_id_prec and case_id_prec not in seen_precedents:
-            seen_precedents[case_id_prec] = prec
-        elif not case_id_prec:
-            # If no case_id, use text hash
-            text_hash = hash(prec.get("text", ""))
-            if text_hash not in seen_precedents:
-                seen_precedents[text_hash] = prec
-    
-    unique_precedents = list(seen_precedents.values())
-    # Sort by similarity score (higher is better)
-    unique_precedents.sort(key=lambda x: x.get("similarity_score", 0), reverse=True)
+        key = ("case_id", case_id_prec) if case_id_prec else ("text", prec.get("text", ""))
+        seen_precedents.setdefault(key, prec)
+    
+    # Top 10 by similarity score (higher is better) without sorting them all
+    top_precedents = heapq.nlargest(10, seen_precedents.values(), key=lambda x: x.get("similarity_score", 0))
     
     # Update case summary to include InLegalBERT results
-    if unique_precedents:
-        case_summary += f"\n    Precedents Found: {len(unique_precedents)} similar legal precedents identified using InLegalBERT."
+    if seen_precedents:
+        case_summary += f"\n    Precedents Found: {len(seen_precedents)} similar legal precedents identified using InLegalBERT."
     
     return {
         "case_id": case_id,
@@ -779,22 +1271,55 @@ async def analyze_case(
             "files": processed_files
         },
         "entities": all_entities,
-        "timeline": sorted(all_timeline, key=lambda x: x.get("date", ""))[:20],  # Sort by date
+        "timeline": heapq.nsmallest(20, all_timeline, key=lambda x: x.get("date", "")),  # Earliest 20 by date
         "legal_issues_identified": all_legal_issues[:10],  # Top 10 issues
         "inlegalbert_results": {
-            "precedents": unique_precedents[:10],  # Top 10 precedents
-            "total_precedents": len(unique_precedents),
+            "precedents": top_precedents,  # Top 10 precedents
+            "total_precedents": len(seen_precedents),
             "ner_tokens_count": len(all_ner_tokens),
             "enabled": INLEGALBERT_AVAILABLE
         },
         "analysis_timestamp": datetime.now().isoformat()
     }
 
+# Raw-body uploads to /analyze/file stay in memory up to this size, then spill to disk
+UPLOAD_SPOOL_MAX = 8 << 20
+
+async def _spool_request_body(request: Request) -> UploadFile:
+    """Stream a raw request body into a spooled temp file without buffering it whole"""
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX)
+    size = 0
+    async for chunk in request.stream():
+        spool.write(chunk)
+        size += len(chunk)
+    spool.seek(0)
+    return UploadFile(
+        file=spool,
+        size=size,
+        filename=request.headers.get("x-filename") or request.query_params.get("filename") or "upload",
+        headers=Headers({"content-type": request.headers.get("content-type") or "application/octet-stream"})
+    )
+
 @app.post("/analyze/file")
-async def analyze_file(file: UploadFile = File(...), case_id: Optional[str] = Form(None)):
-    """Analyze a single file"""
-    result = await process_file(file, case_id or f"case_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-    return result
+async def analyze_file(request: Request, case_id: Optional[str] = None):
+    """
+    Analyze a single file.
+    Accepts multipart form data (file, case_id) or the raw file as the request body,
+    with the file name in an X-Filename header or filename query parameter.
+    """
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        async with request.form() as form:
+            file = form.get("file")
+            if not isinstance(file, StarletteUploadFile):
+                raise HTTPException(status_code=400, detail="No file provided")
+            case_id = case_id or form.get("case_id")
+            return await process_file(file, case_id or f"case_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    
+    file = await _spool_request_body(request)
+    try:
+        return await process_file(file, case_id or f"case_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    finally:
+        await file.close()
 
 if __name__ == "__main__":
     import uvicorn
@@ -7,19 +7,30 @@ This is a standalone FastAPI service that uses the inlegalbert_helper module.
 """
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, PlainTextResponse
 from pydantic import BaseModel
 import os
-import json
-import faiss
-from typing import List, Dict, Optional
+import asyncio
+from typing import List, Dict, Optional, Tuple
 
 # Import helper functions
 from inlegalbert_helper import (
-    initialize_models, embed_text, perform_ner, search_precedents,
-    analyze_with_inlegalbert, load_or_create_faiss
+    initialize_models, embed_text, embed_texts, perform_ner, search_precedents,
+    analyze_with_inlegalbert, load_or_create_faiss, add_precedents, save_faiss, clear_faiss,
+    embedding_cache_stats, find_precedent, precedent_text_file, warmup_models
 )
 
-app = FastAPI(title="Agent-1: InLegalBERT + FAISS Case Analyzer")
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("Warning: orjson not available (optional, responses will use json)")
+
+app = FastAPI(
+    title="Agent-1: InLegalBERT + FAISS Case Analyzer",
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse,
+)
 
 # Add CORS middleware
 app.add_middleware(
@@ -36,20 +47,89 @@ DB_PATH = os.path.join(os.path.dirname(__file__), "precedent_index")
 # Ensure directory exists
 os.makedirs(DB_PATH, exist_ok=True)
 
-# Models will be initialized lazily when first needed
-# This avoids blocking on import (important for tests)
+# Models are loaded and warmed up in the startup handler rather than on import
+# (important for tests, which do not run startup handlers)
 
+# Concurrent /embed and /add_precedent calls are micro-batched: requests wait
+# up to EMBED_BATCH_WAIT seconds to share one padded forward pass
+EMBED_MAX_BATCH = 32
+EMBED_BATCH_WAIT = 0.01
+
+_embed_queue: Optional[asyncio.Queue] = None
+_embed_worker: Optional[asyncio.Task] = None
+
+
+async def _run_embed_batches(queue: asyncio.Queue):
+    """Drain queued texts into batches and resolve each request's future."""
+    loop = asyncio.get_running_loop()
+    while True:
+        items: List[Tuple[str, asyncio.Future]] = [await queue.get()]
+        deadline = loop.time() + EMBED_BATCH_WAIT
+        while len(items) < EMBED_MAX_BATCH:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                items.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            embs = await asyncio.to_thread(embed_texts, [text for text, _ in items])
+        except Exception as e:
+            print(f"Error in embedding batch: {e}")
+            embs = None
+        for row, (_, future) in enumerate(items):
+            if not future.done():
+                future.set_result(None if embs is None else embs[row])
+
+
+def _ensure_embed_worker() -> asyncio.Queue:
+    """Start the batching worker on the running event loop if it is not already there."""
+    global _embed_queue, _embed_worker
+    loop = asyncio.get_running_loop()
+    if _embed_worker is None or _embed_worker.done() or _embed_worker.get_loop() is not loop:
+        _embed_queue = asyncio.Queue()
+        _embed_worker = loop.create_task(_run_embed_batches(_embed_queue))
+    return _embed_queue
+
+
+async def embed_text_batched(text: str):
+    """Embed text through the shared micro-batcher; returns None if models are unavailable."""
+    future = asyncio.get_running_loop().create_future()
+    _ensure_embed_worker().put_nowait((text, future))
+    return await future
+
+
+@app.on_event("startup")
+async def start_embed_worker():
+    """Start the embedding micro-batcher."""
+    _ensure_embed_worker()
 
-def save_index(index, meta, index_file, meta_file):
-    """Save FAISS index and metadata to disk."""
-    try:
-        faiss.write_index(index, index_file)
-        with open(meta_file, "w", encoding="utf-8") as f:
-            json.dump(meta, f, ensure_ascii=False, indent=2)
-        print(f"💾 Saved FAISS index with {len(meta)} precedents")
-    except Exception as e:
-        print(f"❌ Error saving index: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to save index: {e}")
+
+@app.on_event("shutdown")
+async def stop_embed_worker():
+    """Stop the embedding micro-batcher."""
+    if _embed_worker is not None:
+        _embed_worker.cancel()
+
+
+@app.on_event("startup")
+async def warm_up_models():
+    """Load the models and run a dummy forward pass before serving requests."""
+    await asyncio.to_thread(warmup_models)
+
+
+@app.on_event("startup")
+async def load_precedent_store():
+    """Load the FAISS index and metadata once so requests reuse them."""
+    await asyncio.to_thread(load_or_create_faiss)
+
+
+@app.on_event("shutdown")
+async def save_precedent_store():
+    """Write precedents added since the last save."""
+    save_faiss()
 
 
 @app.get("/health")
@@ -94,7 +174,7 @@ async def embed_endpoint(data: dict):
         raise HTTPException(status_code=400, detail="Text is required")
     
     try:
-        emb = embed_text(text)
+        emb = await embed_text_batched(text)
         if emb is None:
             raise HTTPException(status_code=503, detail="Models not available. Cannot generate embedding.")
         return {
@@ -183,25 +263,22 @@ async def add_precedent(data: dict):
     
     try:
         # Generate embedding
-        emb = embed_text(text)
+        emb = await embed_text_batched(text)
         if emb is None:
             raise HTTPException(status_code=503, detail="Models not available. Cannot generate embedding.")
         
         # Load index
-        index, meta, index_file, meta_file = load_or_create_faiss()
+        index, _, _, _ = load_or_create_faiss()
         if index is None:
             raise HTTPException(status_code=500, detail="Failed to load FAISS index")
         
-        # Add to index
-        index.add(np.array([emb]).astype('float32'))
-        meta.append({"id": case_id, "text": text})
-        
-        # Save index
-        save_index(index, meta, index_file, meta_file)
+        # Add to the shared index (rebuilt as IVF-PQ in the background once the
+        # corpus is large enough); written to disk every INDEX_SAVE_EVERY additions
+        total = await asyncio.to_thread(add_precedents, np.array([emb]), [{"id": case_id, "text": text}])
         
         return {
-            "message": f"Precedent added. Total: {len(meta)}",
-            "total": len(meta),
+            "message": f"Precedent added. Total: {total}",
+            "total": total,
             "case_id": case_id
         }
     except HTTPException:
@@ -210,6 +287,12 @@ async def add_precedent(data: dict):
         raise HTTPException(status_code=500, detail=f"Failed to add precedent: {str(e)}")
 
 
+@app.get("/cache/stats")
+async def cache_stats():
+    """Embedding cache hit/miss counters."""
+    return embedding_cache_stats()
+
+
 @app.get("/precedents/count")
 async def get_precedent_count():
     """Get the total number of precedents in the database."""
@@ -220,18 +303,27 @@ async def get_precedent_count():
         raise HTTPException(status_code=500, detail=f"Failed to get count: {str(e)}")
 
 
+@app.get("/precedents/{case_id:path}/text")
+async def get_precedent_text(case_id: str):
+    """Full text of a stored precedent (search results only carry a preview)."""
+    found = find_precedent(case_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Precedent not found")
+    
+    row, entry = found
+    if "text" in entry:
+        return PlainTextResponse(entry["text"])
+    path = precedent_text_file(row)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Precedent text not found")
+    return FileResponse(path, media_type="text/plain; charset=utf-8")
+
+
 @app.delete("/precedents/clear")
 async def clear_precedents():
     """Clear all precedents from the database."""
     try:
-        index_file = os.path.join(DB_PATH, "precedent.index")
-        meta_file = os.path.join(DB_PATH, "meta.json")
-        
-        if os.path.exists(index_file):
-            os.remove(index_file)
-        if os.path.exists(meta_file):
-            os.remove(meta_file)
-        
+        clear_faiss()
         return {"message": "All precedents cleared"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to clear precedents: {str(e)}")
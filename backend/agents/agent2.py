@@ -2,38 +2,429 @@
 Agent 2: Human Feedback Integrator
 Interactive refinement and validation system
 """
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+from typing import Optional, List, Dict, Set, Deque, Tuple, Sequence, Any, Callable, Awaitable, AsyncIterator
+from dataclasses import dataclass, field
 from datetime import datetime
+from collections import ChainMap, defaultdict, deque
+from collections.abc import Mapping
+from itertools import count, groupby, islice
+from urllib.parse import quote
+from cachetools import LRUCache, TTLCache
+import asyncio
+import atexit
+import functools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import zlib
 
-app = FastAPI(title="Agent 2 - Human Feedback Integrator")
+# Case documents are shared through Redis when REDIS_URL is set
+try:
+    import redis.asyncio as aioredis
+    from redis.exceptions import WatchError
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+    print("Warning: redis not available (optional, case documents will be kept in process memory)")
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+try:
+    import orjson
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    def json_dumps(content) -> bytes:
+        return json.dumps(content, default=lambda o: o.isoformat()).encode("utf-8")
+    json_loads = json.loads
+    print("Warning: orjson not available (optional, using json)")
+
+try:
+    import zstandard
+    _compress = zstandard.ZstdCompressor(level=3).compress
+    _decompress = zstandard.ZstdDecompressor().decompress
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    _compress = functools.partial(zlib.compress, level=3)
+    _decompress = zlib.decompress
+    print("Warning: zstandard not available (optional, large documents will be compressed with zlib)")
+
+app = FastAPI(
+    title="Agent 2 - Human Feedback Integrator",
+    default_response_class=ORJSONResponse if ORJSON_AVAILABLE else JSONResponse,
+)
+
+# Log records are queued by request handlers and written to stderr by a
+# background thread, so handlers never block on console I/O
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_handler = logging.StreamHandler()
+_log_handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+_log_listener = logging.handlers.QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+# Request bodies are Pydantic models validated where data enters through a
+# route; stored documents are slotted dataclasses built server-side from
+# already-validated values, so they skip validation and per-instance __dict__
 
 class FeedbackItem(BaseModel):
+    model_config = ConfigDict(frozen=True)  # Shared between feedback history and versions
+    
     section: str
     feedback_type: str  # add, edit, delete, approve
     content: Optional[str] = None
     action: str  # Description of the change
 
 class HumanFeedback(BaseModel):
-    case_id: str
-    feedback_items: List[FeedbackItem]
-    reviewer_notes: Optional[str] = None
-    approval_status: str  # pending, approved, rejected, needs_revision
-    timestamp: datetime
+    case_id: str = ""  # Taken from the URL when submitted
+    feedback_items: List[FeedbackItem] = []
+    reviewer_notes: Optional[str] = ""
+    approval_status: str = "pending"  # pending, approved, rejected, needs_revision
+    timestamp: Optional[datetime] = None  # Defaults to the time the feedback is received
 
-class CaseDocument(BaseModel):
+@dataclass(slots=True)
+class VersionOverlay:
+    # A version is the original document with these sections set or removed;
+    # untouched sections are shared with the original, not copied
+    overlay: Dict[str, Any] = field(default_factory=dict)
+    deleted: List[str] = field(default_factory=list)
+
+@dataclass(slots=True)
+class CaseDocument:
     case_id: str
-    original_document: Dict[str, Any]
-    modified_document: Optional[Dict[str, Any]] = None
-    feedback_history: List[HumanFeedback] = []
-    version: int = 1
-    current_status: str = "pending_review"
+    original_document: Mapping[str, Any]  # A PackedDocument when large (in-memory store)
     created_at: datetime
     updated_at: datetime
+    versions: Dict[int, VersionOverlay] = field(default_factory=dict)  # version 1 is original_document itself
+    version: int = 1
+    current_status: str = "pending_review"
+
+# Converts stored documents to and from JSON (the same shape as a BaseModel)
+_case_document_json = TypeAdapter(CaseDocument)
+
+# The in-memory store keeps original documents larger than PACK_THRESHOLD bytes
+# of JSON compressed; the UNPACKED_CACHE_SIZE most recently read stay decoded
+PACK_THRESHOLD = 16 * 1024
+UNPACKED_CACHE_SIZE = 64
+_unpacked_documents: LRUCache = LRUCache(maxsize=UNPACKED_CACHE_SIZE)
+_pack_ids = count()
+
+class PackedDocument(Mapping):
+    """Read-only original document held as compressed JSON, decoded on first access"""
+    
+    def __init__(self, blob: bytes):
+        self._blob = blob
+        self._id = next(_pack_ids)  # Mappings are unhashable, so cache by id
+    
+    @property
+    def _document(self) -> Dict[str, Any]:
+        document = _unpacked_documents.get(self._id)
+        if document is None:
+            document = _unpacked_documents[self._id] = json_loads(_decompress(self._blob))
+        return document
+    
+    def __getitem__(self, key):
+        return self._document[key]
+    
+    def __iter__(self):
+        return iter(self._document)
+    
+    def __len__(self):
+        return len(self._document)
+    
+    def __del__(self):
+        _unpacked_documents.pop(self._id, None)
+
+def pack_document(document: Dict[str, Any]):
+    """document, or a PackedDocument of it if its JSON is larger than PACK_THRESHOLD"""
+    raw = json_dumps(document)
+    if len(raw) <= PACK_THRESHOLD:
+        return document
+    return PackedDocument(_compress(raw))
+
+# The in-memory store keeps the newest HISTORY_IN_MEMORY feedback entries per
+# case; older ones are appended to a JSONL file per case under HISTORY_PATH
+HISTORY_IN_MEMORY = 200
+HISTORY_PATH = os.path.join(os.path.dirname(__file__), "feedback_history")
+HISTORY_PAGE_MAX = 200
+
+# A document update coroutine receives the stored document (None if the case
+# does not exist yet) and returns the document to store
+DocumentUpdate = Callable[[Optional[CaseDocument]], Awaitable[CaseDocument]]
+
+# Feedback batches with more items than this are processed in a worker thread
+FEEDBACK_THREAD_THRESHOLD = 32
+
+class InMemoryCaseStore:
+    """Case documents and feedback history in process memory (single worker)"""
+    
+    def __init__(self):
+        self._docs: Dict[str, CaseDocument] = {}
+        self._history: Dict[str, Deque[HumanFeedback]] = {}
+        self._spilled: Dict[str, int] = {}  # entries moved to disk, oldest first
+        self._by_status: Dict[str, Set[str]] = defaultdict(set)  # status -> case ids
+        # Guards read-modify-write sequences
+        self._lock = asyncio.Lock()
+    
+    @staticmethod
+    def _history_file(case_id: str) -> str:
+        return os.path.join(HISTORY_PATH, quote(case_id, safe="") + ".jsonl")
+    
+    async def get(self, case_id: str) -> Optional[CaseDocument]:
+        return self._docs.get(case_id)
+    
+    async def put(self, doc: CaseDocument):
+        """Store doc, replacing any earlier document and feedback history for its case"""
+        async def replace(_: Optional[CaseDocument]) -> CaseDocument:
+            return doc
+        
+        await self._write(doc.case_id, replace, reset_history=True)
+    
+    async def update(self, case_id: str, update: DocumentUpdate,
+                     feedback: Sequence[HumanFeedback] = ()) -> CaseDocument:
+        """Apply update to the stored document atomically, appending any feedback to its history"""
+        return await self._write(case_id, update, feedback)
+    
+    async def _write(self, case_id: str, update: DocumentUpdate,
+                     feedback: Sequence[HumanFeedback] = (), reset_history: bool = False) -> CaseDocument:
+        async with self._lock:
+            old = self._docs.get(case_id)
+            old_status = old.current_status if old else None
+            doc = await update(old)
+            if old is None or doc.original_document is not old.original_document:
+                doc.original_document = pack_document(doc.original_document)
+            self._docs[case_id] = doc
+            if old_status != doc.current_status:
+                self._by_status[old_status].discard(case_id)
+                self._by_status[doc.current_status].add(case_id)
+            if reset_history or old is None:
+                # A new or resubmitted case starts with no history; a spill file
+                # for a case this store has not seen was left by an earlier process
+                self._history.pop(case_id, None)
+                self._spilled.pop(case_id, None)
+                await asyncio.to_thread(self._remove_spilled, case_id)
+            for entry in feedback:
+                await self._append_history(case_id, entry)
+            return doc
+    
+    async def _append_history(self, case_id: str, feedback: HumanFeedback):
+        history = self._history.setdefault(case_id, deque(maxlen=HISTORY_IN_MEMORY))
+        if len(history) == HISTORY_IN_MEMORY:
+            # The oldest entry is about to be evicted; keep it on disk
+            await asyncio.to_thread(self._spill, case_id, history[0])
+            self._spilled[case_id] = self._spilled.get(case_id, 0) + 1
+        history.append(feedback)
+    
+    def _spill(self, case_id: str, feedback: HumanFeedback):
+        os.makedirs(HISTORY_PATH, exist_ok=True)
+        with open(self._history_file(case_id), "a", encoding="utf-8") as f:
+            f.write(feedback.model_dump_json() + "\n")
+    
+    def _remove_spilled(self, case_id: str):
+        if os.path.exists(self._history_file(case_id)):
+            os.remove(self._history_file(case_id))
+    
+    def _read_spilled(self, case_id: str, start: int, stop: int) -> List[HumanFeedback]:
+        with open(self._history_file(case_id), "r", encoding="utf-8") as f:
+            return [HumanFeedback.model_validate_json(line) for line in islice(f, start, stop)]
+    
+    async def history(self, case_id: str, start: int, stop: int) -> List[HumanFeedback]:
+        """Feedback entries start..stop-1, oldest first"""
+        spilled = self._spilled.get(case_id, 0)
+        entries = []
+        if start < spilled:
+            entries = await asyncio.to_thread(self._read_spilled, case_id, start, min(stop, spilled))
+        history = self._history.get(case_id, ())
+        entries.extend(islice(history, max(start - spilled, 0), max(stop - spilled, 0)))
+        return entries
+    
+    async def feedback_count(self, case_id: str) -> int:
+        return self._spilled.get(case_id, 0) + len(self._history.get(case_id, ()))
+    
+    async def all(self, status: Optional[str] = None) -> List[CaseDocument]:
+        """Every stored document, or only those with the given status"""
+        if status is None:
+            return list(self._docs.values())
+        return [self._docs[case_id] for case_id in self._by_status.get(status, ())]
+    
+    async def scan(self, status: Optional[str] = None) -> AsyncIterator[CaseDocument]:
+        """Like all(), but yields documents one at a time"""
+        case_ids = list(self._docs if status is None else self._by_status.get(status, ()))
+        for case_id in case_ids:
+            doc = self._docs.get(case_id)
+            if doc is not None:
+                yield doc
+    
+    async def close(self):
+        pass
 
-# In-memory storage (in production, use database)
-case_documents: Dict[str, CaseDocument] = {}
+class RedisCaseStore:
+    """
+    Case documents in Redis, shared by every worker.
+    
+    Each document is a JSON string under case:{case_id}; its feedback history
+    is a list under case:{case_id}:history so appends never rewrite the
+    document. Case ids are kept in the set "cases" and in one set per status
+    under cases:status:{status}.
+    """
+    
+    CASES_KEY = "cases"
+    
+    def __init__(self, client):
+        self._redis = client
+    
+    @staticmethod
+    def _doc_key(case_id: str) -> str:
+        return f"case:{case_id}"
+    
+    @staticmethod
+    def _history_key(case_id: str) -> str:
+        return f"case:{case_id}:history"
+    
+    @staticmethod
+    def _status_key(status: str) -> str:
+        return f"cases:status:{status}"
+    
+    async def get(self, case_id: str) -> Optional[CaseDocument]:
+        raw = await self._redis.get(self._doc_key(case_id))
+        return _case_document_json.validate_json(raw) if raw else None
+    
+    async def put(self, doc: CaseDocument):
+        """Store doc, replacing any earlier document and feedback history for its case"""
+        async def replace(_: Optional[CaseDocument]) -> CaseDocument:
+            return doc
+        
+        await self._write(doc.case_id, replace, reset_history=True)
+    
+    async def update(self, case_id: str, update: DocumentUpdate,
+                     feedback: Sequence[HumanFeedback] = ()) -> CaseDocument:
+        """Apply update to the stored document atomically, appending any feedback to its history"""
+        return await self._write(case_id, update, feedback)
+    
+    async def _write(self, case_id: str, update: DocumentUpdate,
+                     feedback: Sequence[HumanFeedback] = (), reset_history: bool = False) -> CaseDocument:
+        """Read-modify-write in a WATCH/MULTI/EXEC transaction, retried on conflict"""
+        key = self._doc_key(case_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    raw = await pipe.get(key)
+                    old = _case_document_json.validate_json(raw) if raw else None
+                    old_status = old.current_status if old else None
+                    doc = await update(old)
+                    pipe.multi()
+                    pipe.set(key, _case_document_json.dump_json(doc))
+                    pipe.sadd(self.CASES_KEY, case_id)
+                    if old_status != doc.current_status:
+                        if old_status is not None:
+                            pipe.srem(self._status_key(old_status), case_id)
+                        pipe.sadd(self._status_key(doc.current_status), case_id)
+                    if reset_history:
+                        pipe.delete(self._history_key(case_id))
+                    if feedback:
+                        pipe.rpush(self._history_key(case_id), *(entry.model_dump_json() for entry in feedback))
+                    await pipe.execute()
+                    return doc
+                except WatchError:
+                    continue  # Another worker changed the document; re-read and retry
+    
+    async def history(self, case_id: str, start: int, stop: int) -> List[HumanFeedback]:
+        """Feedback entries start..stop-1, oldest first"""
+        if stop <= start:
+            return []
+        entries = await self._redis.lrange(self._history_key(case_id), start, stop - 1)
+        return [HumanFeedback.model_validate_json(entry) for entry in entries]
+    
+    async def feedback_count(self, case_id: str) -> int:
+        return await self._redis.llen(self._history_key(case_id))
+    
+    async def all(self, status: Optional[str] = None) -> List[CaseDocument]:
+        """Every stored document, or only those with the given status"""
+        case_ids = await self._redis.smembers(self.CASES_KEY if status is None else self._status_key(status))
+        if not case_ids:
+            return []
+        raws = await self._redis.mget([self._doc_key(case_id.decode()) for case_id in case_ids])
+        return [_case_document_json.validate_json(raw) for raw in raws if raw]
+    
+    async def scan(self, status: Optional[str] = None, count: int = 500) -> AsyncIterator[CaseDocument]:
+        """Like all(), but fetches documents count ids at a time with SSCAN + MGET"""
+        key = self.CASES_KEY if status is None else self._status_key(status)
+        cursor = 0
+        while True:
+            cursor, case_ids = await self._redis.sscan(key, cursor, count=count)
+            if case_ids:
+                raws = await self._redis.mget([self._doc_key(case_id.decode()) for case_id in case_ids])
+                for raw in raws:
+                    if raw:
+                        yield _case_document_json.validate_json(raw)
+            if cursor == 0:
+                break
+    
+    async def close(self):
+        await self._redis.aclose()
+
+# In-process storage unless REDIS_URL points at a reachable Redis
+case_store = InMemoryCaseStore()
+
+# Serialized GET responses per (endpoint, case_id, params), tagged with the
+# document's updated_at so a change made by any worker is never served stale
+RESPONSE_CACHE_SIZE = 1024
+RESPONSE_CACHE_TTL = 60  # seconds
+_response_cache: TTLCache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
+
+async def cached_response(kind: str, doc: CaseDocument, build: Callable[[], Awaitable[Dict[str, Any]]],
+                          *params) -> Response:
+    """Serve the cached JSON body for doc (and params), building and serializing it only if doc changed"""
+    key = (kind, doc.case_id, *params)
+    cached = _response_cache.get(key)
+    if cached is None or cached[0] != doc.updated_at:
+        cached = (doc.updated_at, json_dumps(await build()))
+        _response_cache[key] = cached
+    return Response(content=cached[1], media_type="application/json")
+
+def invalidate_responses(case_id: str):
+    """Drop cached GET responses for a case after it is written"""
+    for key in [key for key in _response_cache.keys() if key[1] == case_id]:
+        _response_cache.pop(key, None)
+
+@app.on_event("startup")
+async def connect_case_store():
+    """Switch to Redis-backed storage so every worker sees the same cases"""
+    global case_store
+    if not REDIS_URL:
+        return
+    if not REDIS_AVAILABLE:
+        logger.warning("REDIS_URL is set but redis is not installed; keeping case documents in memory")
+        return
+    
+    client = aioredis.from_url(REDIS_URL)
+    try:
+        await client.ping()
+    except Exception as e:
+        logger.warning("Could not connect to Redis (%s); keeping case documents in memory", e)
+        await client.aclose()
+        return
+    case_store = RedisCaseStore(client)
+    logger.info("Storing case documents in Redis")
+
+@app.on_event("shutdown")
+async def close_case_store():
+    """Close the Redis connection pool"""
+    await case_store.close()
 
 @app.get("/health")
 async def health():
@@ -44,14 +435,15 @@ async def submit_for_review(case_id: str, document: Dict[str, Any]):
     """Submit a document from Agent 1 for human review"""
     now = datetime.now()
     
-    case_documents[case_id] = CaseDocument(
+    await case_store.put(CaseDocument(
         case_id=case_id,
         original_document=document,
         version=1,
         current_status="pending_review",
         created_at=now,
         updated_at=now
-    )
+    ))
+    invalidate_responses(case_id)
     
     return {
         "status": "submitted",
@@ -64,174 +456,311 @@ async def submit_for_review(case_id: str, document: Dict[str, Any]):
 @app.get("/documents/{case_id}")
 async def get_document(case_id: str):
     """Retrieve a case document for review"""
-    if case_id not in case_documents:
+    doc = await case_store.get(case_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Case not found")
     
-    doc = case_documents[case_id]
-    return {
-        "case_id": doc.case_id,
-        "document": doc.modified_document or doc.original_document,
-        "version": doc.version,
-        "status": doc.current_status,
-        "feedback_count": len(doc.feedback_history),
-        "created_at": doc.created_at.isoformat(),
-        "updated_at": doc.updated_at.isoformat()
-    }
+    async def build():
+        return {
+            "case_id": doc.case_id,
+            "document": reconstruct(doc, doc.version),
+            "version": doc.version,
+            "status": doc.current_status,
+            "feedback_count": await case_store.feedback_count(case_id),
+            "created_at": doc.created_at,
+            "updated_at": doc.updated_at
+        }
+    
+    return await cached_response("document", doc, build)
+
+# Feedback submitted while an update of its case is in flight waits here and
+# goes into that case's next update, still one document version per submission
+_pending_feedback: Dict[str, List[Tuple[HumanFeedback, asyncio.Future]]] = {}
+_feedback_tasks: Set[asyncio.Task] = set()
+
+async def _apply_pending_feedback(case_id: str):
+    """Apply the feedback queued for case_id, one store update per batch, until none is left"""
+    while _pending_feedback[case_id]:
+        batch = _pending_feedback[case_id]
+        _pending_feedback[case_id] = []
+        await _apply_feedback_batch(case_id, batch)
+    del _pending_feedback[case_id]
+
+async def _apply_feedback_batch(case_id: str, batch: List[Tuple[HumanFeedback, asyncio.Future]]):
+    """Apply queued feedback in submission order, exactly as if submitted one at a time"""
+    feedbacks = [feedback for feedback, _ in batch]
+    now = datetime.now()
+    item_count = sum(len(feedback.feedback_items) for feedback in feedbacks)
+    versions: List[int] = []
+    
+    async def apply_feedback(doc: Optional[CaseDocument]) -> CaseDocument:
+        # Handle case where document might not exist yet (create it)
+        if doc is None:
+            logger.info("Case %s not found in documents, creating new entry", case_id)
+            # Create a minimal document entry
+            doc = CaseDocument(
+                case_id=case_id,
+                original_document={},
+                version=1,
+                current_status="pending_review",
+                created_at=now,
+                updated_at=now
+            )
+        
+        if item_count > FEEDBACK_THREAD_THRESHOLD:
+            # Large batches would block the event loop; the worker gets a plain
+            # dict so a packed original is not decoded off the loop thread
+            overlays = await asyncio.to_thread(feedback_overlays, dict(doc.original_document), feedbacks, doc.version, now)
+        else:
+            overlays = feedback_overlays(doc.original_document, feedbacks, doc.version, now)
+        
+        # The store may retry the update, so versions are rebuilt on every call
+        versions.clear()
+        for feedback, overlay in zip(feedbacks, overlays):
+            # Update status based on approval
+            doc.current_status = feedback.approval_status
+            if overlay is not None:
+                doc.version += 1
+                doc.versions[doc.version] = overlay
+            versions.append(doc.version)
+        
+        doc.updated_at = now
+        return doc
+    
+    try:
+        # Feedback is appended to the case history in the same update
+        await case_store.update(case_id, apply_feedback, feedbacks)
+        invalidate_responses(case_id)
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+    for (_, future), version in zip(batch, versions):
+        if not future.done():
+            future.set_result(version)
 
 @app.post("/documents/{case_id}/feedback")
-async def submit_feedback(case_id: str, feedback: dict):
+async def submit_feedback(case_id: str, feedback: HumanFeedback):
     """Submit human feedback for a case document"""
     # Edge case: Validate case_id
-    if not case_id or not isinstance(case_id, str) or len(case_id.strip()) == 0:
+    if not case_id.strip():
         raise HTTPException(status_code=400, detail="Invalid case_id")
     
-    # Edge case: Validate feedback
-    if not feedback or not isinstance(feedback, dict):
-        raise HTTPException(status_code=400, detail="Invalid feedback data")
-    
-    print(f"Received feedback for case {case_id}: {feedback}")
-    
-    # Handle case where document might not exist yet (create it)
-    if case_id not in case_documents:
-        print(f"Case {case_id} not found in documents, creating new entry")
-        # Create a minimal document entry
-        case_documents[case_id] = CaseDocument(
-            case_id=case_id,
-            original_document={},
-            version=1,
-            current_status="pending_review",
-            created_at=datetime.now(),
-            updated_at=datetime.now()
-        )
+    logger.debug("Received feedback for case %s: %s", case_id, feedback)
+
+    # Autosave/heartbeat submissions carry no changes: answer without queuing a write
+    if not feedback.feedback_items and feedback.approval_status == "pending" and not feedback.reviewer_notes:
+        doc = await case_store.get(case_id)
+        if doc is not None:  # Unknown cases still get their placeholder entry below
+            return {
+                "status": "noop",
+                "case_id": case_id,
+                "approval_status": feedback.approval_status,
+                "version": doc.version,
+                "message": "Feedback successfully processed"
+            }
+
+    feedback.case_id = case_id
+    if feedback.timestamp is None:
+        feedback.timestamp = datetime.now()
     
-    doc = case_documents[case_id]
+    future = asyncio.get_running_loop().create_future()
+    if case_id not in _pending_feedback:
+        _pending_feedback[case_id] = []
+        task = asyncio.create_task(_apply_pending_feedback(case_id))
+        _feedback_tasks.add(task)
+        task.add_done_callback(_feedback_tasks.discard)
+    _pending_feedback[case_id].append((feedback, future))
+    version = await future
     
-    # Convert feedback dict to HumanFeedback model
-    try:
-        if isinstance(feedback, dict):
-            feedback_obj = HumanFeedback(
-                case_id=case_id,
-                feedback_items=feedback.get("feedback_items", []),
-                reviewer_notes=feedback.get("reviewer_notes", ""),
-                approval_status=feedback.get("approval_status", "pending"),
-                timestamp=datetime.fromisoformat(feedback.get("timestamp", datetime.now().isoformat())) if isinstance(feedback.get("timestamp"), str) else datetime.now()
-            )
-        else:
-            feedback_obj = feedback
-    except Exception as e:
-        print(f"Error creating feedback object: {e}")
-        # Create a basic feedback object
-        feedback_obj = HumanFeedback(
-            case_id=case_id,
-            feedback_items=feedback.get("feedback_items", []) if isinstance(feedback, dict) else [],
-            reviewer_notes=feedback.get("reviewer_notes", "") if isinstance(feedback, dict) else "",
-            approval_status=feedback.get("approval_status", "pending") if isinstance(feedback, dict) else "pending",
-            timestamp=datetime.now()
-        )
-    
-    # Add feedback to history
-    doc.feedback_history.append(feedback_obj)
-    
-    # Update status based on approval
-    doc.current_status = feedback_obj.approval_status
-    
-    # Process feedback items to modify document
-    if feedback_obj.approval_status in ["approved", "needs_revision"] and feedback_obj.feedback_items:
-        doc.modified_document = process_feedback(
-            doc.original_document,
-            feedback_obj.feedback_items,
-            doc.version
-        )
-        doc.version += 1
-    
-    doc.updated_at = datetime.now()
-    
-    print(f"Feedback processed successfully for case {case_id}, status: {feedback_obj.approval_status}")
+    logger.info("Feedback processed for case %s, status: %s", case_id, feedback.approval_status)
     
     return {
         "status": "feedback_received",
         "case_id": case_id,
-        "approval_status": feedback_obj.approval_status,
-        "version": doc.version,
+        "approval_status": feedback.approval_status,
+        "version": version,
         "message": "Feedback successfully processed"
     }
 
+@app.get("/documents/{case_id}/versions/{version}")
+async def get_document_version(case_id: str, version: int):
+    """Retrieve an earlier version of a case document"""
+    doc = await case_store.get(case_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Case not found")
+    
+    if version < 1 or version > doc.version:
+        raise HTTPException(status_code=404, detail="Version not found")
+    
+    async def build():
+        return {
+            "case_id": doc.case_id,
+            "version": version,
+            "document": reconstruct(doc, version)
+        }
+    
+    return await cached_response("version", doc, build, version)
+
 @app.post("/documents/{case_id}/approve")
 async def approve_document(case_id: str, approved: bool = True):
     """Approve a document and mark as ready for Agent 3"""
-    if case_id not in case_documents:
-        raise HTTPException(status_code=404, detail="Case not found")
+    async def set_approval(doc: Optional[CaseDocument]) -> CaseDocument:
+        if doc is None:
+            raise HTTPException(status_code=404, detail="Case not found")
+        doc.current_status = "approved" if approved else "rejected"
+        doc.updated_at = datetime.now()
+        return doc
     
-    doc = case_documents[case_id]
-    doc.current_status = "approved" if approved else "rejected"
-    doc.updated_at = datetime.now()
+    doc = await case_store.update(case_id, set_approval)
+    invalidate_responses(case_id)
     
-    return {
-        "status": "approved" if approved else "rejected",
+    # Already plain JSON types, so serialize directly instead of through jsonable_encoder
+    return Response(content=json_dumps({
+        "status": doc.current_status,
         "case_id": case_id,
         "version": doc.version,
         "message": "Document approval updated"
-    }
+    }), media_type="application/json")
 
 @app.get("/documents/{case_id}/history")
-async def get_feedback_history(case_id: str):
-    """Get all feedback history for a case"""
-    if case_id not in case_documents:
+async def get_feedback_history(case_id: str, limit: int = 50, before: Optional[int] = None):
+    """
+    Get feedback history for a case, one page at a time.
+    
+    Returns up to limit entries (oldest first) preceding index before, or the
+    newest entries if before is omitted; pass next_before to get the previous page.
+    """
+    if limit < 1 or limit > HISTORY_PAGE_MAX:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {HISTORY_PAGE_MAX}")
+    
+    # Every feedback append also bumps the document's updated_at
+    doc = await case_store.get(case_id)
+    if doc is None:
         raise HTTPException(status_code=404, detail="Case not found")
     
+    async def build():
+        total = await case_store.feedback_count(case_id)
+        stop = total if before is None else max(0, min(before, total))
+        start = max(0, stop - limit)
+        return {
+            "case_id": case_id,
+            "feedback_history": [
+                {
+                    "timestamp": feedback.timestamp,
+                    "approval_status": feedback.approval_status,
+                    "reviewer_notes": feedback.reviewer_notes,
+                    "items_count": len(feedback.feedback_items),
+                    "items": [item.model_dump() for item in feedback.feedback_items]
+                }
+                for feedback in await case_store.history(case_id, start, stop)
+            ],
+            "total": total,
+            "next_before": start if start > 0 else None
+        }
+    
+    return await cached_response("history", doc, build, limit, before)
+
+def _document_summary(doc: CaseDocument) -> Dict[str, Any]:
     return {
-        "case_id": case_id,
-        "feedback_history": [
-            {
-                "timestamp": feedback.timestamp,
-                "approval_status": feedback.approval_status,
-                "reviewer_notes": feedback.reviewer_notes,
-                "items_count": len(feedback.feedback_items),
-                "items": [item.model_dump() for item in feedback.feedback_items]
-            }
-            for feedback in case_documents[case_id].feedback_history
-        ]
+        "case_id": doc.case_id,
+        "status": doc.current_status,
+        "version": doc.version,
+        "created_at": doc.created_at,
+        "updated_at": doc.updated_at
     }
 
 @app.get("/documents")
-async def list_documents(status: Optional[str] = None):
+async def list_documents(request: Request, status: Optional[str] = None):
     """List all documents with optional status filter"""
-    documents = []
-    for case_id, doc in case_documents.items():
-        if not status or doc.current_status == status:
-            documents.append({
-                "case_id": doc.case_id,
-                "status": doc.current_status,
-                "version": doc.version,
-                "created_at": doc.created_at.isoformat(),
-                "updated_at": doc.updated_at.isoformat()
-            })
+    if "application/x-ndjson" in request.headers.get("accept", ""):
+        # One JSON object per line, produced while the client reads (for large exports)
+        async def stream():
+            async for doc in case_store.scan(status or None):
+                yield json_dumps(_document_summary(doc)) + b"\n"
+        
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    
+    documents = [_document_summary(doc) for doc in await case_store.all(status or None)]
     
     return {"documents": documents, "total": len(documents)}
 
-def process_feedback(original: Dict[str, Any], feedback_items: List[FeedbackItem], version: int) -> Dict[str, Any]:
-    """Process feedback items to create modified document"""
-    modified = original.copy()
-    
-    for item in feedback_items:
-        if item.feedback_type == "add":
-            if item.section not in modified:
-                modified[item.section] = []
-            if isinstance(modified[item.section], list):
-                modified[item.section].append(item.content)
-        elif item.feedback_type == "edit":
-            modified[item.section] = item.content
-        elif item.feedback_type == "delete":
-            if item.section in modified:
-                del modified[item.section]
-    
-    modified["_metadata"] = {
+# Feedback handlers write through a ChainMap of (overlay, original): assignments
+# land in the overlay, and sections removed from the original go in deleted.
+# Each handler receives a run of consecutive items of one type for one section.
+
+def _apply_add(modified: ChainMap, deleted: Set[str], section: str, items: List[FeedbackItem]):
+    current = modified[section] if section in modified and section not in deleted else []
+    if isinstance(current, list):
+        # One copy per run; the original document is left untouched
+        modified[section] = current + [item.content for item in items]
+        deleted.discard(section)
+
+def _apply_edit(modified: ChainMap, deleted: Set[str], section: str, items: List[FeedbackItem]):
+    modified[section] = items[-1].content  # Earlier edits in the run are shadowed
+    deleted.discard(section)
+
+def _apply_delete(modified: ChainMap, deleted: Set[str], section: str, items: List[FeedbackItem]):
+    overlay, original = modified.maps
+    if section in overlay or (section in original and section not in deleted):
+        overlay.pop(section, None)
+        if section in original:
+            deleted.add(section)
+
+def _apply_none(modified: ChainMap, deleted: Set[str], section: str, items: List[FeedbackItem]):
+    pass  # e.g. "approve" items do not change the document
+
+_FEEDBACK_HANDLERS = {"add": _apply_add, "edit": _apply_edit, "delete": _apply_delete}
+
+def _feedback_key(item: FeedbackItem) -> Tuple[str, str]:
+    return item.feedback_type, item.section
+
+def process_feedback(original: Dict[str, Any], feedback_items: List[FeedbackItem], version: int,
+                     modified_at: Optional[datetime] = None) -> VersionOverlay:
+    """Process feedback items into the overlay of sections they change on the original document"""
+    overlay: Dict[str, Any] = {}
+    deleted: Set[str] = set()
+    modified = ChainMap(overlay, original)  # Reads fall through to the original
+    
+    # Runs keep submission order, so interleaved add/edit/delete still apply in sequence
+    handlers = _FEEDBACK_HANDLERS
+    for (feedback_type, section), run in groupby(feedback_items, key=_feedback_key):
+        handlers.get(feedback_type, _apply_none)(modified, deleted, section, list(run))
+    
+    overlay["_metadata"] = {
         "modified_version": version + 1,
-        "last_modified": datetime.now().isoformat(),
+        "last_modified": (modified_at or datetime.now()).isoformat(),
         "feedback_applied": len(feedback_items)
     }
+    deleted.discard("_metadata")
+    
+    return VersionOverlay(overlay=overlay, deleted=sorted(deleted))
+
+def feedback_overlays(original: Dict[str, Any], feedbacks: List[HumanFeedback], version: int,
+                      modified_at: Optional[datetime] = None) -> List[Optional[VersionOverlay]]:
+    """
+    Overlay of the version each feedback creates on top of version, in order
+    (None for feedback that does not change the document)
+    """
+    overlays: List[Optional[VersionOverlay]] = []
+    for feedback in feedbacks:
+        if feedback.approval_status in ["approved", "needs_revision"] and feedback.feedback_items:
+            overlays.append(process_feedback(original, feedback.feedback_items, version, modified_at))
+            version += 1
+        else:
+            overlays.append(None)
+    return overlays
+
+def reconstruct(doc: CaseDocument, version: int) -> Dict[str, Any]:
+    """Flatten a document version: the original with that version's overlay applied"""
+    if version not in doc.versions:
+        return dict(doc.original_document)
     
-    return modified
+    version_overlay = doc.versions[version]
+    document = {key: value for key, value in doc.original_document.items() if key not in version_overlay.deleted}
+    document.update(version_overlay.overlay)
+    return document
 
 if __name__ == "__main__":
     import uvicorn
@@ -2,13 +2,29 @@
 Agent 3: Verdict Synthesizer
 Legal precedent analysis and judgment prediction using REAL DATA from Agent 1
 """
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import List, Dict, Optional
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel, ValidationError, field_validator, model_validator
+from typing import Any, List, Dict, Optional, Set
 import os
 import json
+import asyncio
+import random
+import re
+import time
+import uuid
+from collections import Counter
 from datetime import datetime
 
+# Fast JSON parsing for LLM responses (orjson errors subclass json.JSONDecodeError)
+try:
+    import orjson
+    json_loads = orjson.loads
+    ORJSON_AVAILABLE = True
+except ImportError:
+    json_loads = json.loads
+    ORJSON_AVAILABLE = False
+    print("Warning: orjson not available (optional, using json)")
+
 app = FastAPI(title="Agent 3 - Verdict Synthesizer")
 
 # Set OpenAI API Key (hardcoded)
@@ -16,10 +32,24 @@ OPENAI_API_KEY = "sk-i6oD0lB6SZmxYYAB9PoEQipoCdqUnUMG1QOkDRGAvNnl1y3D"
 
 # Try to import OpenAI
 try:
-    from openai import OpenAI
-    client = OpenAI(
+    import httpx
+    from openai import AsyncOpenAI, RateLimitError, APITimeoutError, APIConnectionError, InternalServerError
+    try:
+        import h2  # noqa: F401 - enables HTTP/2 in httpx
+        HTTP2_AVAILABLE = True
+    except ImportError:
+        HTTP2_AVAILABLE = False
+    # One pooled HTTP transport shared by every OpenAI call so keep-alive
+    # connections (and their TLS sessions) are reused across requests
+    _HTTP = httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100, keepalive_expiry=60),
+        timeout=httpx.Timeout(60.0, connect=5.0)
+    )
+    client = AsyncOpenAI(
         api_key=OPENAI_API_KEY,
-        base_url="https://api.chatanywhere.tech/v1"
+        base_url="https://api.chatanywhere.tech/v1",
+        http_client=_HTTP
     )
     OPENAI_AVAILABLE = True
 except ImportError:
@@ -27,6 +57,14 @@ except ImportError:
     client = None
     print("Warning: openai not installed. Install with: pip install openai")
 
+# Cache of LLM verdicts for repeat cases and cases with the same facts
+try:
+    import verdict_cache
+    VERDICT_CACHE_AVAILABLE = True
+except ImportError:
+    VERDICT_CACHE_AVAILABLE = False
+    print("Warning: verdict cache not available. Install cachetools to enable it.")
+
 class CaseData(BaseModel):
     case_id: str
     key_facts: List[str]
@@ -35,6 +73,32 @@ class CaseData(BaseModel):
     timeline: List[Dict]
     case_summary: Optional[str] = None
 
+class SynthesisRequest(BaseModel):
+    """Case analysis from Agent 1; malformed fields are replaced by empty values"""
+    case_id: str = "case_unknown"
+    key_facts: List = []
+    legal_issues: List = []
+    case_summary: str = ""
+    entities: Dict = {}
+    timeline: List = []
+    
+    @model_validator(mode="before")
+    @classmethod
+    def _legal_issues_alias(cls, data: Any) -> Any:
+        # Handle both 'legal_issues' and 'legal_issues_identified' field names
+        if isinstance(data, dict) and not data.get("legal_issues") and "legal_issues_identified" in data:
+            data = {**data, "legal_issues": data["legal_issues_identified"]}
+        return data
+    
+    @field_validator("*", mode="wrap")
+    @classmethod
+    def _empty_if_malformed(cls, value, handler, info):
+        try:
+            return handler(value)
+        except ValidationError:
+            print(f"WARNING: {info.field_name} is malformed: {type(value)}")
+            return cls.model_fields[info.field_name].get_default(call_default_factory=True)
+
 class Precedent(BaseModel):
     case_name: str
     year: int
@@ -43,6 +107,18 @@ class Precedent(BaseModel):
     outcome: str
     reasoning: str
 
+@app.on_event("shutdown")
+async def save_verdict_cache():
+    """Persist the verdict cache so it survives restarts"""
+    if VERDICT_CACHE_AVAILABLE:
+        verdict_cache.save_cache()
+
+@app.on_event("shutdown")
+async def close_openai_client():
+    """Close pooled OpenAI connections"""
+    if client is not None:
+        await client.close()
+
 @app.get("/health")
 async def health():
     return {
@@ -51,100 +127,161 @@ async def health():
         "openai_enabled": bool(OPENAI_API_KEY) and OPENAI_AVAILABLE
     }
 
-async def analyze_with_openai(case_data: dict) -> dict:
-    """Use OpenAI AI to analyze case data and generate verdict prediction"""
-    if not OPENAI_AVAILABLE or not client:
-        return None
-    
-    try:
-        # Build comprehensive case context
-        key_facts_text = "\n".join([f"- {fact}" for fact in case_data.get("key_facts", [])[:15]])
-        
-        legal_issues_text = ""
-        for issue in case_data.get("legal_issues", [])[:10]:
-            if isinstance(issue, dict):
-                legal_issues_text += f"- {issue.get('issue', 'Unknown')} ({issue.get('severity', 'unknown')}): {issue.get('description', '')}\n"
-            else:
-                legal_issues_text += f"- {issue}\n"
-        
-        entities_text = ""
-        entities = case_data.get("entities", {})
-        if isinstance(entities, dict):
-            if "people" in entities:
-                entities_text += "People: " + ", ".join([p.get("name", str(p)) if isinstance(p, dict) else str(p) for p in entities["people"][:10]]) + "\n"
-            if "organizations" in entities:
-                entities_text += "Organizations: " + ", ".join([o.get("name", str(o)) if isinstance(o, dict) else str(o) for o in entities["organizations"][:10]]) + "\n"
-        
-        timeline_text = ""
-        for event in case_data.get("timeline", [])[:10]:
-            if isinstance(event, dict):
-                timeline_text += f"- {event.get('date', '')} {event.get('time', '')}: {event.get('event', '')}\n"
-            else:
-                timeline_text += f"- {event}\n"
-        
-        case_summary = case_data.get("case_summary", "")[:1000]
-        
-        prompt = f"""You are a senior Indian legal judge and analyst with 30+ years of experience in Indian law. Analyze this case and provide a PRECISE, DATA-DRIVEN verdict prediction based on Indian legal system and precedents.
+# Client-side OpenAI throttling: at most OPENAI_MAX_CONCURRENCY requests in
+# flight and a token bucket refilled at OPENAI_TPM_LIMIT tokens per minute.
+# Rate limits and transient failures (timeouts, dropped connections, 5xx) are
+# retried with exponential backoff before a verdict falls back
+OPENAI_MAX_CONCURRENCY = 20
+OPENAI_TPM_LIMIT = 200000
+OPENAI_RATE_LIMIT_RETRIES = 5
 
-CASE SUMMARY:
-{case_summary}
+_openai_semaphore = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+_bucket_lock = asyncio.Lock()
+_bucket_tokens = float(OPENAI_TPM_LIMIT)
+_bucket_refilled_at = time.monotonic()
 
-KEY FACTS:
-{key_facts_text}
+def _estimate_request_tokens(messages: List[dict], max_tokens: int) -> int:
+    """Estimate prompt plus completion tokens for a chat request (~4 characters per token)"""
+    return max_tokens + sum(len(message["content"]) for message in messages) // 4
 
-LEGAL ISSUES IDENTIFIED:
-{legal_issues_text}
+async def _acquire_tokens(amount: int):
+    """Wait until the token bucket holds amount tokens, then take them"""
+    global _bucket_tokens, _bucket_refilled_at
+    amount = min(amount, OPENAI_TPM_LIMIT)
+    async with _bucket_lock:
+        while True:
+            now = time.monotonic()
+            _bucket_tokens = min(OPENAI_TPM_LIMIT, _bucket_tokens + (now - _bucket_refilled_at) * OPENAI_TPM_LIMIT / 60)
+            _bucket_refilled_at = now
+            if _bucket_tokens >= amount:
+                _bucket_tokens -= amount
+                return
+            await asyncio.sleep((amount - _bucket_tokens) * 60 / OPENAI_TPM_LIMIT)
 
-ENTITIES:
-{entities_text}
+async def create_chat_completion(consume=None, **kwargs):
+    """
+    Rate-limited client.chat.completions.create.
+    Throttles concurrency and token spend, and retries 429s and transient errors with exponential backoff.
+    If consume is given it is awaited on the response (e.g. to drain a stream) while the request
+    still holds its concurrency slot, and its result is returned instead.
+    """
+    estimated_tokens = _estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens", 0))
+    for attempt in range(OPENAI_RATE_LIMIT_RETRIES + 1):
+        async with _openai_semaphore:
+            await _acquire_tokens(estimated_tokens)
+            try:
+                response = await client.chat.completions.create(**kwargs)
+                return await consume(response) if consume else response
+            except (RateLimitError, APITimeoutError, APIConnectionError, InternalServerError) as e:
+                if attempt == OPENAI_RATE_LIMIT_RETRIES:
+                    raise
+                error = type(e).__name__
+        delay = min(2 ** attempt, 60) + random.random()
+        print(f"OpenAI {error}, retrying in {delay:.1f}s (attempt {attempt + 1}/{OPENAI_RATE_LIMIT_RETRIES})")
+        await asyncio.sleep(delay)
 
-TIMELINE:
-{timeline_text}
+# Bulk verdicts go through the OpenAI Batch API (half price, separate rate limits)
+VERDICT_MODEL = "gpt-3.5-turbo"
+BATCH_API_MAX_WAIT = 15 * 60  # seconds to wait for a batch before falling back to direct calls
+
+async def _run_openai_batch(requests: Dict[str, List[dict]]) -> Dict[str, str]:
+    """
+    Submit chat completion requests as one OpenAI Batch API job and wait for it.
+    Maps each custom_id to its response text; raises if the job fails or times out.
+    """
+    lines = [
+        json.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {"model": VERDICT_MODEL, "messages": messages, "temperature": 0.3, "max_tokens": 2000}
+        }, ensure_ascii=False)
+        for custom_id, messages in requests.items()
+    ]
+    batch_file = await client.files.create(
+        file=("verdict_batch.jsonl", "\n".join(lines).encode("utf-8")),
+        purpose="batch"
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h"
+    )
+    print(f"Submitted OpenAI batch {batch.id} with {len(lines)} requests")
+    
+    # Poll with exponential backoff
+    delay, waited = 2, 0
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        if waited >= BATCH_API_MAX_WAIT:
+            await client.batches.cancel(batch.id)
+            raise TimeoutError(f"Batch {batch.id} not finished after {waited}s")
+        await asyncio.sleep(delay)
+        waited += delay
+        delay = min(delay * 2, 60)
+        batch = await client.batches.retrieve(batch.id)
+    
+    if batch.status != "completed" or not batch.output_file_id:
+        raise RuntimeError(f"Batch {batch.id} ended with status {batch.status}")
+    
+    output = await client.files.content(batch.output_file_id)
+    responses = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        record = json_loads(line)
+        choices = ((record.get("response") or {}).get("body") or {}).get("choices") or []
+        if choices and choices[0].get("message", {}).get("content"):
+            responses[record["custom_id"]] = choices[0]["message"]["content"]
+    return responses
 
-Based on the ACTUAL case facts above, provide a PRECISE legal verdict prediction using Indian law. You MUST be decisive - do not default to "mixed outcome" unless the evidence truly supports it.
+# Everything that is the same on every verdict request comes first, byte for
+# byte, so the API can reuse its cached prompt prefix; case data follows it
+VERDICT_SYSTEM_PROMPT = """You are a senior Indian legal judge and analyst with 30+ years of experience in Indian law. You provide precise, data-driven legal verdict predictions based on Indian legal system, Indian Penal Code (IPC), Code of Criminal Procedure (CrPC), and Indian legal precedents. CRITICAL: When providing precedents, you MUST use REAL Indian case names in the format 'State of [State Name] vs [Defendant Name]' (e.g., 'State of Maharashtra vs Rajesh Kumar', 'State of Delhi vs ABC'). NEVER use generic names like 'State v. Johnson' or 'Supreme Court of State X'. All precedents must be from Indian courts: Supreme Court of India, Bombay High Court, Delhi High Court, Madras High Court, Calcutta High Court, Allahabad High Court, or other Indian High Courts. Always reference Indian Penal Code (IPC) sections or relevant Indian statutes. Always return valid JSON.
+
+Based on the ACTUAL case facts given, provide a PRECISE legal verdict prediction using Indian law. You MUST be decisive - do not default to "mixed outcome" unless the evidence truly supports it.
 
 ANALYSIS REQUIREMENTS:
 1. If evidence strongly favors one party, be decisive (likely_liable or likely_not_liable with high confidence)
 2. Only use "moderately_liable" or "Mixed outcome" if evidence is genuinely balanced
 3. Base confidence on the strength and quantity of evidence provided
-4. If {len(case_data.get('key_facts', []))} facts are provided, use them to make a specific prediction
+4. Use every key fact provided (the count is given with the case) to make a specific prediction
 5. If legal issues show high severity, reflect that in the prediction
 6. CRITICAL: Prioritize and cite REAL Indian legal precedents from Indian courts (Supreme Court of India, High Courts, District Courts)
 7. Use Indian legal terminology and reference Indian Penal Code (IPC), Code of Criminal Procedure (CrPC), or relevant Indian statutes where applicable
 
 Return ONLY valid JSON in this exact format:
 
-{{
+{
     "prediction": "likely_liable/moderately_liable/likely_not_liable",
     "verdict_tendency": "Plaintiff favored/Defendant favored/Mixed outcome likely",
     "confidence": 0.0-1.0,
-    "reasoning": "Detailed legal reasoning citing specific facts from the case above and referencing Indian law. Be specific about which facts support your prediction.",
+    "reasoning": "Detailed legal reasoning citing specific facts from the case and referencing Indian law. Be specific about which facts support your prediction.",
     "precedents": [
-        {{
+        {
             "case_name": "REAL Indian case name in format: State of [State Name] vs [Defendant Name] OR [Plaintiff] vs [Defendant] (e.g., State of Maharashtra vs Rajesh Kumar, State of Delhi vs XYZ, etc.)",
             "year": 2015-2024 (recent Indian case year),
             "jurisdiction": "MUST be one of: Supreme Court of India, Bombay High Court, Delhi High Court, Madras High Court, Calcutta High Court, Allahabad High Court, Gujarat High Court, Punjab and Haryana High Court, Karnataka High Court, Kerala High Court, Rajasthan High Court, or any other Indian High Court or District Court",
             "similarity_score": 0.0-1.0,
             "outcome": "Outcome description based on Indian legal system and Indian Penal Code (IPC) or relevant Indian statutes",
             "reasoning": "Why this SPECIFIC INDIAN precedent is relevant to THIS specific case, citing specific legal principles from Indian law, IPC sections, or relevant Indian statutes"
-        }}
+        }
     ],
-    "recommended_action": "Specific, actionable recommendation based on the case facts above and Indian legal procedures",
-    "risk_assessment": {{
+    "recommended_action": "Specific, actionable recommendation based on the case facts and Indian legal procedures",
+    "risk_assessment": {
         "overall_risk": "low/medium/high",
         "confidence_level": "low/moderate/high",
         "strengths": ["Specific strength from the case facts", "Another specific strength"],
         "weaknesses": ["Specific weakness from the case facts", "Another specific weakness"]
-    }},
+    },
     "alternatives": [
-        {{
+        {
             "scenario": "Alternative outcome based on case facts and Indian legal system",
             "probability": 0.0-1.0,
             "description": "Description based on actual case context and Indian law",
             "recommendation": "Specific recommendation following Indian legal procedures"
-        }}
+        }
     ]
-}}
+}
 
 CRITICAL REQUIREMENTS:
 - Be DECISIVE and PRECISE. Use the actual case data to make a specific prediction.
@@ -158,91 +295,215 @@ CRITICAL REQUIREMENTS:
 - Use Indian legal terminology and reference relevant Indian statutes (IPC, CrPC, Evidence Act, etc.).
 - Return ONLY valid JSON."""
 
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a senior Indian legal judge and analyst with 30+ years of experience in Indian law. You provide precise, data-driven legal verdict predictions based on Indian legal system, Indian Penal Code (IPC), Code of Criminal Procedure (CrPC), and Indian legal precedents. CRITICAL: When providing precedents, you MUST use REAL Indian case names in the format 'State of [State Name] vs [Defendant Name]' (e.g., 'State of Maharashtra vs Rajesh Kumar', 'State of Delhi vs ABC'). NEVER use generic names like 'State v. Johnson' or 'Supreme Court of State X'. All precedents must be from Indian courts: Supreme Court of India, Bombay High Court, Delhi High Court, Madras High Court, Calcutta High Court, Allahabad High Court, or other Indian High Courts. Always reference Indian Penal Code (IPC) sections or relevant Indian statutes. Always return valid JSON."},
-                {"role": "user", "content": prompt}
-            ],
+# Shared, never-mutated system message sent first in every verdict request
+VERDICT_SYSTEM_MESSAGE = {"role": "system", "content": VERDICT_SYSTEM_PROMPT}
+
+# Case-specific part of the prompt; the instructions are in VERDICT_SYSTEM_PROMPT
+VERDICT_USER_TEMPLATE = """Analyze this case and provide a PRECISE, DATA-DRIVEN verdict prediction based on Indian legal system and precedents.
+
+CASE SUMMARY:
+{case_summary}
+
+KEY FACTS:
+{key_facts_text}
+
+LEGAL ISSUES IDENTIFIED:
+{legal_issues_text}
+
+ENTITIES:
+{entities_text}
+
+TIMELINE:
+{timeline_text}
+
+NUMBER OF KEY FACTS: {fact_count}
+
+Provide the verdict prediction for this case as specified. Return ONLY valid JSON."""
+
+# Markdown code fence around JSON in LLM responses
+_JSON_FENCE_RE = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL)
+
+def strip_json_fence(response_text: str) -> str:
+    """Return the JSON payload of an LLM response, unwrapping a markdown fence if present"""
+    match = _JSON_FENCE_RE.search(response_text)
+    return (match.group(1) if match else response_text).strip()
+
+def _lookup_cached_verdict(case_data: dict) -> Optional[dict]:
+    """Return the cached verdict for a case, or None"""
+    if VERDICT_CACHE_AVAILABLE:
+        cached = verdict_cache.lookup(case_data)
+        if cached is not None:
+            print("Agent 3: Using cached verdict for case")
+            return cached
+    return None
+
+# Prompts for cases whose key facts are longer than this are built in a worker thread
+PROMPT_THREAD_THRESHOLD = 32 * 1024  # characters
+
+def _prompt_size(case_data: dict) -> int:
+    """Rough size of the prompt text; the key facts are the only part not truncated to a short length"""
+    return sum(len(str(fact)) for fact in case_data.get("key_facts", [])[:15])
+
+def _verdict_messages(case_data: dict) -> List[dict]:
+    """Chat messages asking the LLM for a verdict prediction on one case"""
+    # Build comprehensive case context
+    key_facts_text = "\n".join([f"- {fact}" for fact in case_data.get("key_facts", [])[:15]])
+    
+    legal_issues_text = ""
+    for issue in case_data.get("legal_issues", [])[:10]:
+        if isinstance(issue, dict):
+            legal_issues_text += f"- {issue.get('issue', 'Unknown')} ({issue.get('severity', 'unknown')}): {issue.get('description', '')}\n"
+        else:
+            legal_issues_text += f"- {issue}\n"
+    
+    entities_text = ""
+    entities = case_data.get("entities", {})
+    if isinstance(entities, dict):
+        if "people" in entities:
+            entities_text += "People: " + ", ".join([p.get("name", str(p)) if isinstance(p, dict) else str(p) for p in entities["people"][:10]]) + "\n"
+        if "organizations" in entities:
+            entities_text += "Organizations: " + ", ".join([o.get("name", str(o)) if isinstance(o, dict) else str(o) for o in entities["organizations"][:10]]) + "\n"
+    
+    timeline_text = ""
+    for event in case_data.get("timeline", [])[:10]:
+        if isinstance(event, dict):
+            timeline_text += f"- {event.get('date', '')} {event.get('time', '')}: {event.get('event', '')}\n"
+        else:
+            timeline_text += f"- {event}\n"
+    
+    prompt = VERDICT_USER_TEMPLATE.format_map({
+        "case_summary": case_data.get("case_summary", "")[:1000],
+        "key_facts_text": key_facts_text,
+        "legal_issues_text": legal_issues_text,
+        "entities_text": entities_text,
+        "timeline_text": timeline_text,
+        "fact_count": len(case_data.get("key_facts", []))
+    })
+    return [VERDICT_SYSTEM_MESSAGE, {"role": "user", "content": prompt}]
+
+def _parse_verdict(response_text: str) -> Optional[dict]:
+    """Parse the JSON verdict out of an LLM response; None if it is not valid JSON"""
+    response_text = strip_json_fence(response_text)
+    try:
+        return json_loads(response_text)
+    except json.JSONDecodeError as e:
+        print(f"JSON parsing error: {e}")
+        print(f"Response text: {response_text[:500]}")
+        return None
+
+async def _stream_text(stream) -> str:
+    """Collect streamed tokens as they arrive and join them once at the end"""
+    chunks = []
+    async for event in stream:
+        if event.choices and event.choices[0].delta.content:
+            chunks.append(event.choices[0].delta.content)
+    return "".join(chunks)
+
+async def analyze_with_openai(case_data: dict) -> dict:
+    """Use OpenAI AI to analyze case data and generate verdict prediction"""
+    if not OPENAI_AVAILABLE or not client:
+        return None
+    
+    try:
+        if _prompt_size(case_data) > PROMPT_THREAD_THRESHOLD:
+            # Building a very large prompt would block the event loop
+            messages = await asyncio.to_thread(_verdict_messages, case_data)
+        else:
+            messages = _verdict_messages(case_data)
+        # The stream is drained inside the rate limiter, so it keeps its slot until the last token
+        response_text = await create_chat_completion(
+            model=VERDICT_MODEL,
+            messages=messages,
             temperature=0.3,
-            max_tokens=2000
+            max_tokens=2000,
+            stream=True,
+            consume=_stream_text
         )
         
-        response_text = response.choices[0].message.content.strip()
-        
-        # Clean JSON response
-        if "```json" in response_text:
-            json_start = response_text.find("```json") + 7
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        elif "```" in response_text:
-            json_start = response_text.find("```") + 3
-            json_end = response_text.find("```", json_start)
-            response_text = response_text[json_start:json_end].strip()
-        
-        # Parse JSON
-        try:
-            verdict_data = json.loads(response_text)
-            return verdict_data
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {e}")
-            print(f"Response text: {response_text[:500]}")
-            return None
+        return _parse_verdict(response_text)
     except Exception as e:
         print(f"OpenAI analysis error: {str(e)}")
         import traceback
         traceback.print_exc()
         return None
 
-@app.post("/synthesize")
-async def synthesize_verdict(request_data: dict):
-    """Synthesize verdict prediction based on REAL case analysis from Agent 1"""
-    
-    # Extract information from request data (handle both field names)
-    case_id = request_data.get("case_id", "case_unknown")
-    key_facts = request_data.get("key_facts", [])
-    # Handle both 'legal_issues' and 'legal_issues_identified' field names
-    legal_issues = request_data.get("legal_issues", []) or request_data.get("legal_issues_identified", [])
-    case_summary = request_data.get("case_summary", "")
-    entities = request_data.get("entities", {})
-    timeline = request_data.get("timeline", [])
-    
+def _case_data(request: SynthesisRequest) -> dict:
+    """Case data the verdict is built from"""
+    entities = request.entities
     print(f"\n=== Agent 3: Processing synthesis ===")
-    print(f"Case ID: {case_id}")
-    print(f"Key Facts: {len(key_facts) if isinstance(key_facts, list) else 0}")
-    print(f"Legal Issues: {len(legal_issues) if isinstance(legal_issues, list) else 0}")
-    print(f"Entities - People: {len(entities.get('people', [])) if isinstance(entities, dict) else 0}")
-    print(f"Entities - Organizations: {len(entities.get('organizations', [])) if isinstance(entities, dict) else 0}")
-    print(f"Timeline Events: {len(timeline) if isinstance(timeline, list) else 0}")
-    print(f"Case Summary Length: {len(case_summary) if isinstance(case_summary, str) else 0} chars")
+    print(f"Case ID: {request.case_id}")
+    print(f"Key Facts: {len(request.key_facts)}")
+    print(f"Legal Issues: {len(request.legal_issues)}")
+    print(f"Entities - People: {len(entities.get('people', []))}")
+    print(f"Entities - Organizations: {len(entities.get('organizations', []))}")
+    print(f"Timeline Events: {len(request.timeline)}")
+    print(f"Case Summary Length: {len(request.case_summary)} chars")
     print("=" * 40)
+    return request.model_dump()
+
+# Cases with no key facts, no legal issues and a summary shorter than this get
+# the deterministic verdict; an LLM can add nothing to them
+MIN_SUMMARY_CHARS = 20
+
+def _too_little_data(case_data: dict) -> bool:
+    """True if a case carries too little information to be worth an LLM call"""
+    if case_data["key_facts"] or case_data["legal_issues"] or len(case_data["case_summary"].strip()) >= MIN_SUMMARY_CHARS:
+        return False
+    print(f"Agent 3: Case {case_data['case_id']} has too little data for LLM analysis, using fallback")
+    return True
+
+@app.post("/synthesize")
+async def synthesize_verdict(request: SynthesisRequest):
+    """Synthesize verdict prediction based on REAL case analysis from Agent 1"""
+    case_data = _case_data(request)
+    if _too_little_data(case_data):
+        return _verdict_response(case_data, None)
     
-    # Validate data types
-    if not isinstance(key_facts, list):
-        print(f"WARNING: key_facts is not a list: {type(key_facts)}")
-        key_facts = []
-    if not isinstance(legal_issues, list):
-        print(f"WARNING: legal_issues is not a list: {type(legal_issues)}")
-        legal_issues = []
-    if not isinstance(entities, dict):
-        print(f"WARNING: entities is not a dict: {type(entities)}")
-        entities = {}
-    if not isinstance(timeline, list):
-        print(f"WARNING: timeline is not a list: {type(timeline)}")
-        timeline = []
-    
-    # Build case data structure
-    case_data = {
-        "case_id": case_id,
-        "key_facts": key_facts if isinstance(key_facts, list) else [],
-        "legal_issues": legal_issues if isinstance(legal_issues, list) else [],
-        "case_summary": case_summary,
-        "entities": entities if isinstance(entities, dict) else {},
-        "timeline": timeline if isinstance(timeline, list) else []
-    }
+    # Use OpenAI AI to analyze real case data, unless an identical case or
+    # one with the same facts was analyzed before
+    openai_result = _lookup_cached_verdict(case_data)
+    if openai_result is None:
+        openai_result = await analyze_with_openai(case_data)
+        if openai_result and VERDICT_CACHE_AVAILABLE:
+            verdict_cache.store(case_data, openai_result)
     
-    # Use OpenAI AI to analyze real case data
-    openai_result = await analyze_with_openai(case_data)
+    return _verdict_response(case_data, openai_result)
+
+# Words in the key facts that point towards either party in the fallback verdict
+PLAINTIFF_INDICATORS = ('breach', 'violation', 'fraud', 'negligence', 'liable', 'damages', 'injury', 'harm', 'wrongful')
+DEFENDANT_INDICATORS = ('defense', 'justified', 'authorized', 'permitted', 'lawful', 'valid', 'compliance')
+
+# Aho-Corasick automaton finds every indicator in a single pass over the facts
+try:
+    import ahocorasick
+    _INDICATOR_AUTOMATON = ahocorasick.Automaton()
+    for _word in PLAINTIFF_INDICATORS:
+        _INDICATOR_AUTOMATON.add_word(_word, ("P", _word))
+    for _word in DEFENDANT_INDICATORS:
+        _INDICATOR_AUTOMATON.add_word(_word, ("D", _word))
+    _INDICATOR_AUTOMATON.make_automaton()
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+    print("Warning: pyahocorasick not available (optional, using substring keyword scan)")
+
+def _indicator_scores(facts_lower: str):
+    """Return (plaintiff, defendant) counts of distinct indicators occurring in lowercased facts"""
+    if AHOCORASICK_AVAILABLE:
+        found = {match for _, match in _INDICATOR_AUTOMATON.iter(facts_lower)}
+        plaintiff_score = sum(1 for tag, _ in found if tag == "P")
+        return plaintiff_score, len(found) - plaintiff_score
+    return (sum(1 for word in PLAINTIFF_INDICATORS if word in facts_lower),
+            sum(1 for word in DEFENDANT_INDICATORS if word in facts_lower))
+
+def _verdict_response(case_data: dict, openai_result: Optional[dict]) -> dict:
+    """Verdict response from the LLM analysis, or from the case data alone if there is none"""
+    case_id = case_data["case_id"]
+    key_facts = case_data["key_facts"]
+    legal_issues = case_data["legal_issues"]
+    case_summary = case_data["case_summary"]
+    entities = case_data["entities"]
+    timeline = case_data["timeline"]
     
     if openai_result:
         # Use OpenAI's analysis
@@ -282,19 +543,14 @@ async def synthesize_verdict(request_data: dict):
         
         # Determine prediction based on actual legal issues and facts
         if legal_issues:
-            # Check severity of issues
-            high_severity_count = sum(1 for issue in legal_issues 
-                                     if isinstance(issue, dict) and issue.get("severity", "").lower() == "high")
-            medium_severity_count = sum(1 for issue in legal_issues 
-                                       if isinstance(issue, dict) and issue.get("severity", "").lower() == "medium")
+            # Check severity of issues (one pass counts every severity)
+            severities = Counter(issue.get("severity", "").lower() for issue in legal_issues if isinstance(issue, dict))
+            high_severity_count = severities["high"]
+            medium_severity_count = severities["medium"]
             
             # Analyze key facts for indicators
-            facts_lower = " ".join([str(f).lower() for f in key_facts[:10]])
-            plaintiff_indicators = ['breach', 'violation', 'fraud', 'negligence', 'liable', 'damages', 'injury', 'harm', 'wrongful']
-            defendant_indicators = ['defense', 'justified', 'authorized', 'permitted', 'lawful', 'valid', 'compliance']
-            
-            plaintiff_score = sum(1 for word in plaintiff_indicators if word in facts_lower)
-            defendant_score = sum(1 for word in defendant_indicators if word in facts_lower)
+            facts_lower = " ".join(str(f).lower() for f in key_facts[:10])
+            plaintiff_score, defendant_score = _indicator_scores(facts_lower)
             
             # Make decisive prediction based on evidence
             if high_severity_count > 0 or plaintiff_score > defendant_score + 2:
@@ -423,6 +679,104 @@ The prediction is based on the actual evidence and legal issues extracted from t
             "document_url": None
         }
 
+@app.post("/synthesize_batch")
+async def synthesize_verdict_batch(cases: List[SynthesisRequest]):
+    """Synthesize verdicts for several cases, analyzing them concurrently"""
+    results = await asyncio.gather(*(synthesize_verdict(case) for case in cases))
+    return {"results": results, "count": len(results)}
+
+async def _synthesize_bulk(cases: List[SynthesisRequest]) -> List[dict]:
+    """
+    Synthesize verdicts for many cases through one OpenAI Batch API job (cheaper, separate
+    rate limits, may take minutes). Cached cases are skipped; cases missing from the batch
+    output, or all of them if the batch cannot be completed, fall back to direct calls.
+    """
+    case_data = [_case_data(case) for case in cases]
+    degenerate = {i for i, data in enumerate(case_data) if _too_little_data(data)}
+    results: List[Optional[dict]] = [
+        None if i in degenerate else _lookup_cached_verdict(data) for i, data in enumerate(case_data)
+    ]
+    
+    pending = [i for i, result in enumerate(results) if result is None and i not in degenerate]
+    responses = {}
+    if pending and OPENAI_AVAILABLE and client:
+        try:
+            requests = await asyncio.to_thread(lambda: {str(i): _verdict_messages(case_data[i]) for i in pending})
+            responses = await _run_openai_batch(requests)
+        except Exception as e:
+            print(f"OpenAI Batch API failed ({e}), using direct calls")
+    
+    async def finish(i: int) -> dict:
+        openai_result = results[i]
+        if openai_result is None and i not in degenerate:
+            if str(i) in responses:
+                openai_result = _parse_verdict(responses[str(i)])
+            if openai_result is None:
+                openai_result = await analyze_with_openai(case_data[i])
+            if openai_result and VERDICT_CACHE_AVAILABLE:
+                verdict_cache.store(case_data[i], openai_result)
+        return _verdict_response(case_data[i], openai_result)
+    
+    return await asyncio.gather(*(finish(i) for i in range(len(case_data))))
+
+# Bulk synthesis runs in the background; its job (status and, once done, results)
+# stays available for BULK_JOB_TTL seconds after it finishes
+BULK_JOB_TTL = 60 * 60
+_bulk_jobs: Dict[str, dict] = {}
+_bulk_job_expiry: Dict[str, float] = {}
+_bulk_tasks: Set[asyncio.Task] = set()
+
+def _prune_bulk_jobs():
+    """Forget finished jobs older than BULK_JOB_TTL"""
+    now = time.monotonic()
+    for job_id in [job_id for job_id, expiry in _bulk_job_expiry.items() if expiry < now]:
+        del _bulk_job_expiry[job_id]
+        _bulk_jobs.pop(job_id, None)
+
+async def _run_bulk_job(job_id: str, cases: List[SynthesisRequest]):
+    job = _bulk_jobs[job_id]
+    try:
+        results = await _synthesize_bulk(cases)
+        job.update(status="completed", results=results)
+    except Exception as e:
+        print(f"Bulk synthesis job {job_id} failed: {e}")
+        job.update(status="failed", error=str(e))
+    job["finished_at"] = datetime.now().isoformat()
+    _bulk_job_expiry[job_id] = time.monotonic() + BULK_JOB_TTL
+
+@app.post("/synthesize_bulk")
+async def synthesize_verdict_bulk(cases: List[SynthesisRequest]):
+    """
+    Start synthesizing verdicts for many cases through the OpenAI Batch API.
+    Returns a job id at once; poll the status_url for the results.
+    """
+    _prune_bulk_jobs()
+    job_id = uuid.uuid4().hex
+    _bulk_jobs[job_id] = {
+        "job_id": job_id,
+        "status": "running",
+        "count": len(cases),
+        "created_at": datetime.now().isoformat()
+    }
+    task = asyncio.create_task(_run_bulk_job(job_id, cases))
+    _bulk_tasks.add(task)
+    task.add_done_callback(_bulk_tasks.discard)
+    return {
+        "job_id": job_id,
+        "status": "running",
+        "count": len(cases),
+        "status_url": f"/synthesize_bulk/{job_id}"
+    }
+
+@app.get("/synthesize_bulk/{job_id}")
+async def get_bulk_job(job_id: str):
+    """Status of a bulk synthesis job, with its results once completed"""
+    _prune_bulk_jobs()
+    job = _bulk_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @app.get("/precedents/search")
 async def search_precedents(query: str, jurisdiction: Optional[str] = None):
     """Search for similar legal precedents"""
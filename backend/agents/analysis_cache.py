@@ -0,0 +1,119 @@
+"""
+Analysis Cache Module
+Exact-match response cache for LLM document analysis.
+Repeat documents are answered from cache instead of re-sending the full
+prompt to OpenAI. There is no near-duplicate tier: truncated mean-pooled
+InLegalBERT embeddings of documents sharing legal boilerplate are too
+similar to tell apart, so a semantic hit could return another document's
+facts and entities.
+"""
+import os
+import json
+import copy
+import hashlib
+from typing import Dict, Optional
+from cachetools import TTLCache
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "analysis_cache")
+EXACT_CACHE_SIZE = 2048
+EXACT_CACHE_TTL = 3600  # seconds
+
+# Global cache state
+_exact: TTLCache = TTLCache(maxsize=EXACT_CACHE_SIZE, ttl=EXACT_CACHE_TTL)
+_loaded = False
+
+
+def _content_key(content: bytes) -> str:
+    """SHA-256 key for exact-match lookups."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def _text_key(text: str) -> str:
+    """SHA-256 key of document text for exact-match lookups."""
+    return _content_key(text.encode("utf-8"))
+
+
+def _ensure_loaded():
+    """Load the persisted cache from disk on first use."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    entries_file = os.path.join(CACHE_PATH, "cache.json")
+    if os.path.exists(entries_file):
+        try:
+            with open(entries_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            for entry in entries[-EXACT_CACHE_SIZE:]:
+                _exact[entry["key"]] = entry["analysis"]
+            print(f"✅ Loaded analysis cache with {len(_exact)} entries")
+        except Exception as e:
+            print(f"⚠️ Error loading analysis cache: {e}. Starting empty.")
+
+
+def lookup(text: str) -> Optional[Dict]:
+    """
+    Find a cached analysis for text.
+
+    Args:
+        text: Document text that was (or would be) sent to the LLM
+
+    Returns:
+        Copy of the cached analysis, or None on a miss
+    """
+    _ensure_loaded()
+
+    cached = _exact.get(_text_key(text))
+    return copy.deepcopy(cached) if cached is not None else None
+
+
+def store(text: str, analysis: Dict):
+    """
+    Cache a successful analysis for text.
+
+    Args:
+        text: Document text that was sent to the LLM
+        analysis: Parsed analysis returned by the LLM
+    """
+    _ensure_loaded()
+
+    _exact[_text_key(text)] = copy.deepcopy(analysis)
+
+
+def lookup_image(image_content: bytes) -> Optional[Dict]:
+    """
+    Find a cached vision analysis for identical image bytes.
+
+    Args:
+        image_content: Raw uploaded image bytes
+
+    Returns:
+        Copy of the cached analysis, or None on a miss
+    """
+    _ensure_loaded()
+
+    cached = _exact.get(_content_key(image_content))
+    return copy.deepcopy(cached) if cached is not None else None
+
+
+def store_image(image_content: bytes, analysis: Dict):
+    """Cache a successful vision analysis for image bytes."""
+    _ensure_loaded()
+
+    _exact[_content_key(image_content)] = copy.deepcopy(analysis)
+
+
+def save_cache():
+    """Persist the cache (at most EXACT_CACHE_SIZE entries) to disk."""
+    entries = [{"key": key, "analysis": analysis} for key, analysis in list(_exact.items())]
+    if not entries:
+        return
+
+    try:
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        with open(os.path.join(CACHE_PATH, "cache.json"), "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        print(f"💾 Saved analysis cache with {len(entries)} entries")
+    except Exception as e:
+        print(f"❌ Error saving analysis cache: {e}")
@@ -4,10 +4,27 @@ Provides NER and FAISS precedent retrieval functionality for integration into ot
 """
 import os
 import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
 import numpy as np
 from typing import List, Dict, Optional, Tuple
 import torch
 
+try:
+    import orjson
+    json_loads = orjson.loads
+    
+    def _meta_line(entry: Dict) -> bytes:
+        return orjson.dumps(entry) + b"\n"
+except ImportError:
+    json_loads = json.loads
+    
+    def _meta_line(entry: Dict) -> bytes:
+        return (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+
 # Try to import transformers and faiss
 try:
     from transformers import AutoTokenizer, AutoModelForTokenClassification, AutoModel
@@ -17,8 +34,55 @@ except ImportError:
     TRANSFORMERS_AVAILABLE = False
     print("Warning: transformers or faiss not available. InLegalBERT features will be disabled.")
 
+# ONNX Runtime runs the models on CPU with fused attention kernels
+try:
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTModelForTokenClassification, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    _ORT_MODEL_CLASSES = {"embed": ORTModelForFeatureExtraction, "ner": ORTModelForTokenClassification}
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+    print("Warning: optimum[onnxruntime] not available (optional, only used with INLEGALBERT_CPU_ONNX=1)")
+
+# Searches run on a GPU copy of the index when faiss is built with GPU support
+FAISS_GPU_AVAILABLE = (
+    TRANSFORMERS_AVAILABLE and torch.cuda.is_available()
+    and hasattr(faiss, "StandardGpuResources") and faiss.get_num_gpus() > 0
+)
+
 MODEL_ID = "law-ai/InLegalBERT"
 DB_PATH = os.path.join(os.path.dirname(__file__), "precedent_index")
+BATCH_SIZE = 16  # Texts per padded forward pass
+EMBEDDING_DIM = 768
+
+# Precedents start in an HNSW graph over FP16 vectors (no training needed)
+# until there are enough vectors to train IVF; the store is then rebuilt in
+# the background as IVF-PQ (32-byte codes) with an FP16 re-rank of the top PQ candidates
+HNSW_M = 32  # Graph neighbours per vector
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVF_INDEX_FACTORY = "IVF256,PQ32x8,Refine(SQfp16)"
+IVF_TRAIN_MIN = 39 * 256  # faiss wants ~39 training points per centroid
+IVF_NPROBE = 16
+RERANK_CANDIDATES = 100
+
+# Precedent additions are written to disk in batches (and on shutdown)
+INDEX_SAVE_EVERY = 20
+
+# Metadata keeps only a short preview; full precedent texts live in one file per row
+PREVIEW_CHARS = 150
+
+# On CPU the models' Linear layers run as dynamically quantized INT8
+# (set INLEGALBERT_CPU_INT8=0 to keep FP32)
+CPU_INT8 = os.getenv("INLEGALBERT_CPU_INT8", "1") != "0"
+
+# Opt-in: on CPU the models are exported once to ONNX and run with ONNX Runtime
+# (set INLEGALBERT_CPU_ONNX=1 with optimum installed; the first start exports them)
+CPU_ONNX = os.getenv("INLEGALBERT_CPU_ONNX", "0") == "1"
+ONNX_PATH = os.path.join(os.path.dirname(__file__), "inlegal_onnx")
+
+# LRU cache of embeddings for recently seen texts
+EMBEDDING_CACHE_SIZE = 10000
 
 # Global model variables
 tokenizer = None
@@ -26,10 +90,94 @@ ner_model = None
 embed_model = None
 device = None
 
+_embedding_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embedding_cache_lock = threading.Lock()
+_embedding_cache_stats = {"hits": 0, "misses": 0}
+
+# Process-wide precedent store, loaded once and reused by every search and add
+_faiss_lock = threading.RLock()
+_faiss_index = None
+_faiss_meta: List[Dict] = []
+_faiss_path: Optional[str] = None
+_faiss_mtime: Optional[float] = None
+_meta_lines = 0  # entries currently in meta.jsonl
+_unsaved_adds = 0
+_gpu_resources = None
+_gpu_index = None  # GPU copy of _faiss_index for search; the CPU index is what gets saved
+_ivf_rebuild: Optional[threading.Thread] = None  # Background IVF-PQ rebuild, if one was started
+
+def _model_dtype(device) -> torch.dtype:
+    """BF16 on GPUs that support it, FP16 on other GPUs, FP32 on CPU."""
+    if device.type != "cuda":
+        return torch.float32
+    return torch.bfloat16 if torch.cuda.is_bf16_supported() else torch.float16
+
+
+def _quantize_int8(model):
+    """Dynamically quantize a model's Linear layers to INT8; returns the FP32 model on failure."""
+    try:
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    except Exception as e:
+        print(f"⚠️ INT8 quantization failed: {e}. Using FP32.")
+        return model
+
+
+def _build_onnx_dir(target_dir: str, build):
+    """
+    Create target_dir by calling build(tmp_dir) on a temporary directory and renaming it
+    into place, so other agents loading the helper never see a half-written export.
+    """
+    if os.path.isdir(target_dir):
+        return
+    os.makedirs(ONNX_PATH, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=ONNX_PATH)
+    try:
+        build(tmp_dir)
+        os.rename(tmp_dir, target_dir)
+    except OSError:
+        # Another process finished the same export first
+        if not os.path.isdir(target_dir):
+            raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _load_onnx(name: str):
+    """
+    Load an ONNX Runtime copy of a model (INT8 unless CPU_INT8 is off), exporting and
+    quantizing it into ONNX_PATH on first use. Returns None on failure.
+    """
+    model_cls = _ORT_MODEL_CLASSES[name]
+    export_dir = os.path.join(ONNX_PATH, name)
+    quantized_dir = os.path.join(ONNX_PATH, f"{name}_int8")
+    try:
+        _build_onnx_dir(export_dir, lambda tmp_dir: model_cls.from_pretrained(
+            MODEL_ID, export=True, provider="CPUExecutionProvider").save_pretrained(tmp_dir))
+        if not CPU_INT8:
+            return model_cls.from_pretrained(export_dir, provider="CPUExecutionProvider")
+        _build_onnx_dir(quantized_dir, lambda tmp_dir: ORTQuantizer.from_pretrained(export_dir).quantize(
+            save_dir=tmp_dir,
+            quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        ))
+        return model_cls.from_pretrained(quantized_dir, file_name="model_quantized.onnx", provider="CPUExecutionProvider")
+    except Exception as e:
+        print(f"⚠️ ONNX export of the {name} model failed: {e}. Using PyTorch.")
+        return None
+
+
+def _cpu_model(model, name: str):
+    """CPU inference model: the ONNX Runtime copy if available, else the PyTorch model (INT8 if enabled)."""
+    if CPU_ONNX and ONNX_AVAILABLE:
+        ort_model = _load_onnx(name)
+        if ort_model is not None:
+            return ort_model
+    return _quantize_int8(model) if CPU_INT8 else model
+
+
 # Initialize models
 def initialize_models():
     """Initialize InLegalBERT models."""
-    global tokenizer, ner_model, embed_model, device
+    global tokenizer, ner_model, embed_model, device, _pool
     
     if not TRANSFORMERS_AVAILABLE:
         return False
@@ -47,22 +195,117 @@ def initialize_models():
         
         embed_model = AutoModel.from_pretrained(MODEL_ID)
         device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        embed_model.to(device)
+        # Half precision runs the matmuls on GPU tensor cores; CPU stays FP32
+        dtype = _model_dtype(device)
+        embed_model = embed_model.eval().to(device=device, dtype=dtype)
         if ner_model:
-            ner_model.to(device)
-        print(f"✅ InLegalBERT models loaded successfully on {device}")
+            ner_model = ner_model.eval().to(device=device, dtype=dtype)
+        if device.type == "cpu":
+            embed_model = _cpu_model(embed_model, "embed")
+            if ner_model:
+                ner_model = _cpu_model(ner_model, "ner")
+        if device.type == "cuda" and hasattr(torch, "compile"):
+            embed_model = torch.compile(embed_model, dynamic=True)
+            _pool = torch.compile(mean_pooling, dynamic=True)
+        print(f"✅ InLegalBERT models loaded successfully on {device} ({dtype})")
         return True
     except Exception as e:
         print(f"❌ Error loading InLegalBERT models: {e}")
         return False
 
 
+def warmup_models() -> bool:
+    """
+    Load the models and run one dummy forward pass through each, so the
+    first request does not pay for weight paging, kernel selection or
+    torch.compile tracing.
+    
+    Returns:
+        True if the models are loaded
+    """
+    if not initialize_models():
+        return False
+    try:
+        inputs = _encode(["warmup"])
+        _embed(inputs)
+        if ner_model is not None:
+            _ner(inputs)
+        print("🔥 InLegalBERT models warmed up")
+    except Exception as e:
+        print(f"⚠️ Model warmup failed: {e}")
+    return True
+
+
 def mean_pooling(token_embeds, attention_mask):
     """Mean pooling for sentence embeddings."""
-    input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeds.size()).float()
-    sum_embeddings = torch.sum(token_embeds * input_mask_expanded, 1)
-    sum_mask = input_mask_expanded.sum(1).clamp(min=1e-9)
-    return sum_embeddings / sum_mask
+    # Broadcast the mask instead of materializing an expanded copy
+    mask = attention_mask.unsqueeze(-1).to(token_embeds.dtype)
+    return (token_embeds * mask).sum(1) / mask.sum(1).clamp_min(1e-9)
+
+
+# Pooling function used by _embed; replaced by a fused torch.compile graph on GPU
+_pool = mean_pooling
+
+
+def _encode(texts):
+    """Tokenize one text or a list of texts into padded model inputs on the model device."""
+    inputs = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=512)
+    if device is not None and device.type == "cuda":
+        # Pinned host memory lets the copy run asynchronously with queued GPU work;
+        # the later .cpu() on the outputs synchronizes
+        return {k: v.pin_memory().to(device, non_blocking=True) for k, v in inputs.items()}
+    return inputs.to(device)
+
+
+def _embed(inputs) -> np.ndarray:
+    """Run the embedding model on tokenized inputs; returns normalized rows (n x 768)."""
+    with torch.inference_mode():
+        out = embed_model(**inputs)
+        embs = _pool(out.last_hidden_state.float(), inputs["attention_mask"])
+        # Normalize on the model device so only the final rows are copied back
+        return torch.nn.functional.normalize(embs, p=2, dim=-1).cpu().numpy()
+
+
+def _ner(inputs) -> List[List[Dict]]:
+    """Run the NER model on tokenized inputs; returns one entry list per row."""
+    with torch.inference_mode():
+        logits = ner_model(**inputs).logits
+    preds = torch.argmax(logits, dim=-1).cpu().numpy()
+    input_ids = inputs["input_ids"].cpu().numpy()
+    attention_mask = inputs["attention_mask"].cpu().numpy()
+    return [_ner_entries(input_ids[row], preds[row], attention_mask[row]) for row in range(len(preds))]
+
+
+def _embedding_key(text: str) -> str:
+    """Cache key for text (surrounding whitespace does not change the embedding)."""
+    return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+
+
+def _cached_embedding(key: str) -> Optional[np.ndarray]:
+    """Return a copy of the cached embedding for key, or None on a miss."""
+    with _embedding_cache_lock:
+        emb = _embedding_cache.get(key)
+        if emb is None:
+            _embedding_cache_stats["misses"] += 1
+            return None
+        _embedding_cache.move_to_end(key)
+        _embedding_cache_stats["hits"] += 1
+        return emb.copy()
+
+
+def _cache_embedding(key: str, emb: np.ndarray):
+    """Store an embedding, evicting the least recently used entry when full."""
+    with _embedding_cache_lock:
+        _embedding_cache[key] = emb.copy()
+        _embedding_cache.move_to_end(key)
+        while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+            _embedding_cache.popitem(last=False)
+
+
+def embedding_cache_stats() -> Dict:
+    """Hit/miss counters and current size of the embedding cache."""
+    with _embedding_cache_lock:
+        return {**_embedding_cache_stats, "size": len(_embedding_cache), "max_size": EMBEDDING_CACHE_SIZE}
 
 
 def embed_text(text: str) -> Optional[np.ndarray]:
@@ -75,24 +318,58 @@ def embed_text(text: str) -> Optional[np.ndarray]:
     Returns:
         Normalized embedding vector (768-dim) or None if models not available
     """
+    embs = embed_texts([text])
+    return None if embs is None else embs[0]
+
+
+def embed_texts(texts: List[str]) -> Optional[np.ndarray]:
+    """
+    Generate embeddings for a batch of texts using InLegalBERT.
+    
+    Args:
+        texts: Input texts to embed
+        
+    Returns:
+        Normalized embedding matrix (len(texts) x 768) or None if models not available
+    """
     if not TRANSFORMERS_AVAILABLE or tokenizer is None or embed_model is None:
         return None
     
     try:
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512).to(device)
-        with torch.no_grad():
-            out = embed_model(**inputs, return_dict=True)
-            token_embeds = out.last_hidden_state
-            emb = mean_pooling(token_embeds, inputs["attention_mask"]).cpu().numpy()[0]
+        keys = [_embedding_key(text) for text in texts]
+        cached = [_cached_embedding(key) for key in keys]
+        missing = [i for i, emb in enumerate(cached) if emb is None]
+        
+        # Batch uncached texts of similar length together to cut padding waste
+        order = sorted(missing, key=lambda i: len(texts[i]))
+        for start in range(0, len(order), BATCH_SIZE):
+            rows = order[start:start + BATCH_SIZE]
+            for i, emb in zip(rows, _embed(_encode([texts[i] for i in rows]))):
+                cached[i] = emb
+                _cache_embedding(keys[i], emb)
         
-        # Normalize embedding
-        emb = emb / np.linalg.norm(emb).clip(min=1e-9)
-        return emb
+        return np.stack(cached)
     except Exception as e:
-        print(f"Error generating embedding: {e}")
+        print(f"Error generating embeddings: {e}")
         return None
 
 
+def _ner_entries(input_ids: np.ndarray, preds: np.ndarray, attention_mask: np.ndarray) -> List[Dict]:
+    """
+    Turn one row of NER predictions into token entries, skipping special and padding tokens.
+    InLegalBERT has no trained token-classification head (its labels are LABEL_0/LABEL_1),
+    so there is no "O" label to filter on; every input token is returned.
+    """
+    id2label = ner_model.config.id2label
+    special_ids = [i for i in tokenizer.all_special_ids if i != tokenizer.unk_token_id]
+    keep = attention_mask.astype(bool) & ~np.isin(input_ids, special_ids)
+    tokens = tokenizer.convert_ids_to_tokens(input_ids[keep].tolist())
+    return [
+        {"token": t, "label_id": p, "label": id2label.get(p, str(p))}
+        for t, p in zip(tokens, preds[keep].tolist())
+    ]
+
+
 def perform_ner(text: str) -> List[Dict]:
     """
     Perform Named Entity Recognition on text.
@@ -101,64 +378,347 @@ def perform_ner(text: str) -> List[Dict]:
         text: Input text for NER
         
     Returns:
-        List of NER results with tokens and label IDs
+        List of NER results with tokens, label IDs and label names
     """
     if not TRANSFORMERS_AVAILABLE or tokenizer is None or ner_model is None:
         return []
     
     try:
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512).to(device)
-        with torch.no_grad():
-            logits = ner_model(**inputs).logits
-        preds = torch.argmax(logits, dim=-1).cpu().numpy()[0]
-        tokens = tokenizer.convert_ids_to_tokens(inputs["input_ids"][0])
-        ner_output = [{"token": t, "label_id": int(p)} for t, p in zip(tokens, preds)]
-        return ner_output
+        return _ner(_encode(text))[0]
     except Exception as e:
         print(f"Error performing NER: {e}")
         return []
 
 
-def load_or_create_faiss() -> Tuple[Optional[object], List[Dict], str, str]:
+def perform_ner_batch(texts: List[str]) -> List[List[Dict]]:
     """
-    Load existing FAISS index or create a new one.
+    Perform Named Entity Recognition on a batch of texts.
     
+    Args:
+        texts: Input texts for NER
+        
     Returns:
-        tuple: (index, metadata, index_file_path, meta_file_path)
+        One list of NER results (tokens, label IDs and label names) per input text
     """
-    if not TRANSFORMERS_AVAILABLE:
-        return None, [], "", ""
-    
-    dim = 768
-    os.makedirs(DB_PATH, exist_ok=True)
-    index_file = os.path.join(DB_PATH, "precedent.index")
-    meta_file = os.path.join(DB_PATH, "meta.json")
+    if not TRANSFORMERS_AVAILABLE or tokenizer is None or ner_model is None:
+        return [[] for _ in texts]
     
-    if os.path.exists(index_file) and os.path.exists(meta_file):
+    try:
+        results = []
+        for start in range(0, len(texts), BATCH_SIZE):
+            results.extend(_ner(_encode(texts[start:start + BATCH_SIZE])))
+        return results
+    except Exception as e:
+        print(f"Error performing NER: {e}")
+        return [[] for _ in texts]
+
+
+def _create_index():
+    """
+    New HNSW precedent index storing FP16 vectors, searched in ~log(N) graph steps.
+    Embeddings are L2-normalized, so inner product is cosine similarity.
+    """
+    index = faiss.IndexHNSWSQ(EMBEDDING_DIM, faiss.ScalarQuantizer.QT_fp16, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    return index
+
+
+def _is_untrained(index) -> bool:
+    """True for indexes that need no training (flat, FP16 or HNSW), i.e. not yet rebuilt as IVF-PQ."""
+    return isinstance(index, (faiss.IndexFlat, faiss.IndexScalarQuantizer, faiss.IndexHNSW))
+
+
+def _store_files() -> Tuple[str, str]:
+    """Paths of the index file and the append-only metadata log under DB_PATH."""
+    return os.path.join(DB_PATH, "precedent.index"), os.path.join(DB_PATH, "meta.jsonl")
+
+
+def _texts_dir() -> str:
+    """Directory holding the full text of each precedent under DB_PATH."""
+    return os.path.join(DB_PATH, "texts")
+
+
+def precedent_text_file(row: int) -> str:
+    """Path of the full-text file for the precedent stored at row."""
+    return os.path.join(_texts_dir(), f"{row}.txt")
+
+
+def _preview(text: str) -> str:
+    """Short preview of a precedent text as returned in search results."""
+    return text[:PREVIEW_CHARS] + "..." if len(text) > PREVIEW_CHARS else text
+
+
+def _legacy_meta_file() -> str:
+    """Path of the metadata file written before the switch to JSONL."""
+    return os.path.join(DB_PATH, "meta.json")
+
+
+def _file_mtime(path: str) -> Optional[float]:
+    """Modification time of path, or None if it does not exist."""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _read_meta(meta_file: str) -> Tuple[List[Dict], int]:
+    """Read metadata entries and the number of lines in the JSONL log (0 if only legacy JSON exists)."""
+    if os.path.exists(meta_file):
+        with open(meta_file, "rb") as f:
+            meta = [json_loads(line) for line in f if line.strip()]
+        return meta, len(meta)
+    with open(_legacy_meta_file(), "rb") as f:
+        return json_loads(f.read()), 0
+
+
+def _read_store(index_file: str, meta_file: str):
+    """Read the index and metadata from disk, or create an empty index."""
+    global _meta_lines
+    _meta_lines = 0
+    if os.path.exists(index_file) and (os.path.exists(meta_file) or os.path.exists(_legacy_meta_file())):
         try:
             index = faiss.read_index(index_file)
-            with open(meta_file, "r", encoding="utf-8") as f:
-                meta = json.load(f)
+            meta, _meta_lines = _read_meta(meta_file)
+            if len(meta) > index.ntotal:
+                # Precedents logged after the last index save were never indexed
+                print(f"⚠️ Dropping {len(meta) - index.ntotal} precedents missing from the index")
+                meta = meta[:index.ntotal]
             print(f"✅ Loaded FAISS index with {len(meta)} precedents")
+            return index, meta
         except Exception as e:
             print(f"⚠️ Error loading index: {e}. Creating new index.")
-            index = faiss.IndexFlatL2(dim)
-            meta = []
-    else:
-        index = faiss.IndexFlatL2(dim)
-        meta = []
-        print("📝 Created new FAISS index")
+            return _create_index(), []
+    print("📝 Created new FAISS index")
+    return _create_index(), []
+
+
+def _append_meta(meta: List[Dict], entries: List[Dict]):
+    """Append entries to the metadata log, rewriting it first if it no longer matches meta."""
+    global _meta_lines
+    _, meta_file = _store_files()
+    existing = meta[:len(meta) - len(entries)]
+    if _meta_lines != len(existing):
+        with open(meta_file, "wb") as f:
+            f.writelines(_meta_line(entry) for entry in existing)
+        if os.path.exists(_legacy_meta_file()):
+            os.remove(_legacy_meta_file())
+    with open(meta_file, "ab") as f:
+        f.writelines(_meta_line(entry) for entry in entries)
+    _meta_lines = len(meta)
+
+
+def load_or_create_faiss() -> Tuple[Optional[object], List[Dict], str, str]:
+    """
+    Return the shared FAISS index, loading it from disk on first use.
+    
+    The store is re-read only when DB_PATH changes or another process
+    rewrites the index file.
+    
+    Returns:
+        tuple: (index, metadata, index_file_path, meta_file_path)
+    """
+    global _faiss_index, _faiss_meta, _faiss_path, _faiss_mtime, _unsaved_adds, _gpu_index
+    if not TRANSFORMERS_AVAILABLE:
+        return None, [], "", ""
+    
+    index_file, meta_file = _store_files()
+    with _faiss_lock:
+        stale = _unsaved_adds == 0 and _file_mtime(index_file) != _faiss_mtime
+        if _faiss_path != DB_PATH or stale:
+            os.makedirs(DB_PATH, exist_ok=True)
+            _faiss_index, _faiss_meta = _read_store(index_file, meta_file)
+            _gpu_index = _gpu_copy(_faiss_index)
+            _faiss_path = DB_PATH
+            _faiss_mtime = _file_mtime(index_file)
+            _unsaved_adds = 0
+            _schedule_ivf_rebuild()
+        return _faiss_index, _faiss_meta, index_file, meta_file
+
+
+def save_faiss():
+    """Write the shared index to disk if there are unsaved additions (metadata is logged per add)."""
+    global _faiss_mtime, _unsaved_adds
+    with _faiss_lock:
+        if _faiss_index is None or _unsaved_adds == 0:
+            return
+        index_file, _ = _store_files()
+        faiss.write_index(_faiss_index, index_file)
+        _faiss_mtime = _file_mtime(index_file)
+        _unsaved_adds = 0
+        print(f"💾 Saved FAISS index with {len(_faiss_meta)} precedents")
+
+
+def add_precedents(embeddings: np.ndarray, entries: List[Dict]) -> int:
+    """
+    Add precedents to the shared index and metadata.
+    
+    Args:
+        embeddings: Normalized embedding matrix (n x 768)
+        entries: One metadata dict ({"id", "text"}) per embedding; the text is
+            written to its own file and only a preview is kept in metadata
+        
+    Returns:
+        Total number of precedents after the addition
+    """
+    global _faiss_index, _unsaved_adds, _gpu_index
+    with _faiss_lock:
+        index, meta, _, _ = load_or_create_faiss()
+        os.makedirs(_texts_dir(), exist_ok=True)
+        entries = [dict(entry) for entry in entries]
+        for row, entry in enumerate(entries, start=len(meta)):
+            text = entry.pop("text")
+            with open(precedent_text_file(row), "w", encoding="utf-8") as f:
+                f.write(text)
+            entry["preview"] = _preview(text)
+        _faiss_index = add_to_index(index, embeddings)
+        if _gpu_index is not None:
+            _gpu_index.add(np.asarray(embeddings, dtype='float32'))
+        meta.extend(entries)
+        _append_meta(meta, entries)
+        _unsaved_adds += len(entries)
+        if _unsaved_adds >= INDEX_SAVE_EVERY:
+            save_faiss()
+        _schedule_ivf_rebuild()
+        return len(meta)
+
+
+def find_precedent(case_id: str) -> Optional[Tuple[int, Dict]]:
+    """Row and metadata of the most recently added precedent with case_id, or None."""
+    _, meta, _, _ = load_or_create_faiss()
+    for row in range(len(meta) - 1, -1, -1):
+        if str(meta[row].get("id", row)) == case_id:
+            return row, meta[row]
+    return None
+
+
+def clear_faiss():
+    """Remove every precedent from memory and disk."""
+    global _faiss_index, _faiss_meta, _faiss_path, _faiss_mtime, _meta_lines, _unsaved_adds, _gpu_index
+    with _faiss_lock:
+        for path in (*_store_files(), _legacy_meta_file()):
+            if os.path.exists(path):
+                os.remove(path)
+        shutil.rmtree(_texts_dir(), ignore_errors=True)
+        _faiss_index, _faiss_meta = _create_index(), []
+        _gpu_index = _gpu_copy(_faiss_index)
+        _faiss_path, _faiss_mtime, _meta_lines, _unsaved_adds = DB_PATH, None, 0, 0
+
+
+def _gpu_copy(index):
+    """
+    GPU copy of index for searching, or None to search on CPU.
+    
+    Untrained stores are mirrored as a GPU flat index with FP16 storage
+    (brute force on GPU beats graph search); IVF-PQ is cloned when faiss
+    supports it on GPU.
+    """
+    global _gpu_resources
+    if not FAISS_GPU_AVAILABLE or index is None:
+        return None
+    try:
+        if _gpu_resources is None:
+            _gpu_resources = faiss.StandardGpuResources()
+        if _is_untrained(index):
+            config = faiss.GpuIndexFlatConfig()
+            config.useFloat16 = True
+            gpu_index = faiss.GpuIndexFlat(_gpu_resources, index.d, index.metric_type, config)
+            if index.ntotal:
+                gpu_index.add(index.reconstruct_n(0, index.ntotal))
+            return gpu_index
+        gpu_index = faiss.index_cpu_to_gpu(_gpu_resources, 0, index)
+        faiss.GpuParameterSpace().set_index_parameter(gpu_index, "nprobe", IVF_NPROBE)
+        return gpu_index
+    except Exception as e:
+        print(f"⚠️ Searching precedents on CPU, index not supported on GPU: {e}")
+        return None
+
+
+def add_to_index(index, embeddings: np.ndarray):
+    """
+    Add embeddings to the precedent index.
     
-    return index, meta, index_file, meta_file
+    An untrained index that has grown to IVF_TRAIN_MIN vectors is rebuilt as
+    IVF-PQ in the background (see _schedule_ivf_rebuild), not here.
+    
+    Args:
+        index: FAISS index returned by load_or_create_faiss
+        embeddings: Normalized embedding matrix (n x 768)
+        
+    Returns:
+        The index now holding the embeddings
+    """
+    index.add(np.asarray(embeddings, dtype='float32'))
+    return index
 
 
-def search_precedents(text: str, top_k: int = 5) -> List[Dict]:
+def _schedule_ivf_rebuild():
+    """
+    Start rebuilding the shared index as IVF-PQ in a background thread once the
+    untrained index holds IVF_TRAIN_MIN vectors. Call with _faiss_lock held.
+    """
+    global _ivf_rebuild
+    if _faiss_index is None or not _is_untrained(_faiss_index) or _faiss_index.ntotal < IVF_TRAIN_MIN:
+        return
+    if _ivf_rebuild is not None and _ivf_rebuild.is_alive():
+        return
+    _ivf_rebuild = threading.Thread(target=_rebuild_ivf, args=(_faiss_index,), daemon=True)
+    _ivf_rebuild.start()
+
+
+def _rebuild_ivf(index):
+    """
+    Train an IVF-PQ index on the vectors of index without holding _faiss_lock,
+    so searches and additions keep using index meanwhile; then swap it in
+    (with any vectors added during training) and save it.
+    """
+    global _faiss_index, _gpu_index, _unsaved_adds
+    with _faiss_lock:
+        count = index.ntotal
+        vectors = index.reconstruct_n(0, count)
+    print(f"🔧 Training {IVF_INDEX_FACTORY} index on {count} precedents in the background...")
+    try:
+        ivf_index = faiss.index_factory(index.d, IVF_INDEX_FACTORY, faiss.METRIC_INNER_PRODUCT)
+        ivf_index.train(vectors)
+        ivf_index.add(vectors)
+    except Exception as e:
+        print(f"⚠️ IVF-PQ rebuild failed, keeping the current index: {e}")
+        return
+    
+    with _faiss_lock:
+        if _faiss_index is not index:
+            return  # The store was cleared or reloaded while training
+        if index.ntotal > count:
+            ivf_index.add(index.reconstruct_n(count, index.ntotal - count))
+        _faiss_index = ivf_index
+        _gpu_index = _gpu_copy(ivf_index)
+        _unsaved_adds = max(_unsaved_adds, 1)  # The rebuilt index is not on disk yet
+        save_faiss()
+
+
+def _search_index(index, queries: np.ndarray, k: int):
+    """Search the precedent index, walking the HNSW graph or probing IVF lists and re-ranking PQ candidates."""
+    if _gpu_index is not None and index is _faiss_index:
+        return _gpu_index.search(np.asarray(queries, dtype='float32'), k)
+    params = None
+    if isinstance(index, faiss.IndexHNSW):
+        # efSearch is not saved with the index, so pass it on every search
+        params = faiss.SearchParametersHNSW(efSearch=max(HNSW_EF_SEARCH, k))
+    elif isinstance(index, faiss.IndexRefine):
+        params = faiss.IndexRefineSearchParameters(
+            k_factor=max(1, RERANK_CANDIDATES // k),
+            base_index_params=faiss.SearchParametersIVF(nprobe=IVF_NPROBE)
+        )
+    return index.search(np.asarray(queries, dtype='float32'), k, params=params)
+
+
+def search_precedents(text: str, top_k: int = 5, embedding: Optional[np.ndarray] = None) -> List[Dict]:
     """
     Search for similar precedents using FAISS.
     
     Args:
         text: Input text to search for
         top_k: Number of top precedents to retrieve
+        embedding: Embedding of text if the caller already has it
         
     Returns:
         List of precedent dictionaries with text, distance, case_id, similarity_score
@@ -166,35 +726,68 @@ def search_precedents(text: str, top_k: int = 5) -> List[Dict]:
     if not TRANSFORMERS_AVAILABLE:
         return []
     
-    try:
-        # Generate embedding
-        emb = embed_text(text)
-        if emb is None:
-            return []
+    emb = embedding if embedding is not None else embed_text(text)
+    if emb is None:
+        return []
+    return search_precedents_batch(np.array([emb]), top_k)[0]
+
+
+def _format_precedents(distances, indices, meta: List[Dict], metric: int) -> List[Dict]:
+    """
+    Build precedent dictionaries from one row of FAISS search results.
+    
+    Inner-product scores are already cosine similarities; stores created
+    before the switch from L2 keep their old 1 / (1 + distance) score.
+    """
+    # Drop empty slots (-1) and rows missing from meta before building any dicts
+    indices = np.asarray(indices)
+    valid = (indices >= 0) & (indices < len(meta))
+    distances, indices = np.asarray(distances)[valid], indices[valid]
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        similarities = np.clip(distances, -1, 1)  # FP16 codes can overshoot slightly
+        distances = 1 - similarities
+    else:
+        similarities = 1 / (1 + distances)
+    
+    precedents = []
+    for dist, sim, idx in zip(distances.tolist(), similarities.tolist(), indices.tolist()):
+        entry = meta[idx]
+        precedents.append({
+            # Stores written before previews were introduced keep the full text inline
+            "text": entry["preview"] if "preview" in entry else _preview(entry["text"]),
+            "distance": dist,
+            "case_id": entry.get("id", idx),
+            "similarity_score": sim
+        })
+    return precedents
+
+
+def search_precedents_batch(embeddings: np.ndarray, top_k: int = 5) -> List[List[Dict]]:
+    """
+    Search for similar precedents for a batch of embeddings with one FAISS query.
+    
+    Args:
+        embeddings: Normalized embedding matrix (n x 768)
+        top_k: Number of top precedents to retrieve per embedding
         
-        # Load FAISS index
+    Returns:
+        One list of precedent dictionaries per embedding
+    """
+    if not TRANSFORMERS_AVAILABLE or embeddings is None:
+        return []
+    
+    try:
         index, meta, _, _ = load_or_create_faiss()
         if index is None or len(meta) == 0:
-            return []
+            return [[] for _ in range(len(embeddings))]
         
-        # Search
         k = min(top_k, len(meta))
-        D, I = index.search(np.array([emb]).astype('float32'), k)
-        
-        precedents = []
-        for dist, idx in zip(D[0], I[0]):
-            if idx < len(meta):
-                precedents.append({
-                    "text": meta[idx]["text"][:150] + "..." if len(meta[idx]["text"]) > 150 else meta[idx]["text"],
-                    "distance": float(dist),
-                    "case_id": meta[idx].get("id", idx),
-                    "similarity_score": float(1 / (1 + dist))
-                })
-        
-        return precedents
+        with _faiss_lock:
+            D, I = _search_index(index, embeddings, k)
+        return [_format_precedents(D[row], I[row], meta, index.metric_type) for row in range(len(embeddings))]
     except Exception as e:
         print(f"Error searching precedents: {e}")
-        return []
+        return [[] for _ in range(len(embeddings))]
 
 
 def analyze_with_inlegalbert(text: str, top_k_precedents: int = 5) -> Dict:
@@ -233,27 +826,85 @@ def analyze_with_inlegalbert(text: str, top_k_precedents: int = 5) -> Dict:
     
     result["inlegalbert_available"] = True
     
-    # Perform NER
+    # Tokenize once and share the inputs between the NER and embedding passes
     try:
-        ner_output = perform_ner(text)
-        result["ner"] = ner_output
+        inputs = _encode(text)
     except Exception as e:
-        print(f"NER failed: {e}")
+        print(f"Tokenization failed: {e}")
+        return result
     
-    # Search precedents
+    # Perform NER
+    if ner_model is not None:
+        try:
+            result["ner"] = _ner(inputs)[0]
+        except Exception as e:
+            print(f"NER failed: {e}")
+    
+    # Embed once; the same embedding is cached and used for precedent search
     try:
-        precedents = search_precedents(text, top_k_precedents)
-        result["precedents"] = precedents
+        emb = _embed(inputs)
+        _cache_embedding(_embedding_key(text), emb[0])
+        result["embedding_dim"] = emb.shape[1]
+        result["precedents"] = search_precedents_batch(emb, top_k_precedents)[0]
     except Exception as e:
         print(f"Precedent search failed: {e}")
     
-    # Get embedding dimension
+    return result
+
+
+def analyze_with_inlegalbert_batch(texts: List[str], top_k_precedents: int = 5) -> List[Dict]:
+    """
+    Perform complete InLegalBERT analysis on several texts at once.
+    
+    NER and embeddings run as padded batches and all precedent searches
+    share a single FAISS query.
+    
+    Args:
+        texts: Input texts to analyze
+        top_k_precedents: Number of precedents to retrieve per text
+        
+    Returns:
+        One dictionary per text with ner, precedents, and embedding info
+    """
+    results = [
+        {"ner": [], "precedents": [], "embedding_dim": 0, "inlegalbert_available": False}
+        for _ in texts
+    ]
+    
+    if not TRANSFORMERS_AVAILABLE or not texts:
+        return results
+    
+    # Initialize models if not already done (lazy initialization)
+    if tokenizer is None:
+        try:
+            if not initialize_models():
+                return results
+        except Exception as e:
+            print(f"Warning: Failed to initialize InLegalBERT models: {e}")
+            return results
+    
+    # Check if models are actually loaded
+    if embed_model is None:
+        return results
+    
+    for result in results:
+        result["inlegalbert_available"] = True
+    
+    # Perform NER
     try:
-        emb = embed_text(text)
-        if emb is not None:
-            result["embedding_dim"] = len(emb)
+        for result, ner_output in zip(results, perform_ner_batch(texts)):
+            result["ner"] = ner_output
     except Exception as e:
-        print(f"Embedding failed: {e}")
+        print(f"NER failed: {e}")
     
-    return result
-
+    # Embed once, then search precedents for the whole batch
+    try:
+        embs = embed_texts(texts)
+        if embs is not None:
+            for result, precedents in zip(results, search_precedents_batch(embs, top_k_precedents)):
+                result["precedents"] = precedents
+                result["embedding_dim"] = embs.shape[1]
+    except Exception as e:
+        print(f"Precedent search failed: {e}")
+    
+    return results
@@ -0,0 +1,25 @@
+"""
+PDF Pages Module
+Per-page PDF text extraction for Agent 1. Kept free of the service's heavy
+imports (torch, transformers, openai) because the PDF worker processes
+import it fresh instead of forking the service.
+"""
+import io
+from typing import List
+
+import PyPDF2
+
+
+def extract_page_text(pdf_reader, page_index: int) -> str:
+    """Extract text from one PDF page, returning "" on failure"""
+    try:
+        return pdf_reader.pages[page_index].extract_text() or ""
+    except Exception as e:
+        print(f"Warning: Error extracting page {page_index+1}: {e}")
+        return ""
+
+
+def extract_pdf_pages(file_content: bytes, start: int, end: int) -> List[str]:
+    """Extract text from pages [start, end) of a PDF (runs in a worker process)"""
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
+    return [extract_page_text(pdf_reader, i) for i in range(start, end)]
@@ -4,11 +4,28 @@ Pytest configuration and shared fixtures.
 import pytest
 import os
 import sys
+import threading
 from pathlib import Path
 
+from fastapi.testclient import TestClient
+
 # Add parent directory to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+# Seconds the models get to load before the model tests are skipped
+MODEL_LOAD_TIMEOUT = float(os.getenv("MODEL_LOAD_TIMEOUT", "120"))
+
+# Texts the model tests embed; embedded once up front so their requests hit the embedding cache
+EMBED_TEXTS = [
+    "This is a test legal case.",
+    "The defendant was charged with theft under Section 379 of IPC.",
+    "State of Maharashtra vs Rajesh Kumar: The court held that...",
+    "Another test case precedent.",
+    "Test precedent",
+    "State of Maharashtra vs Rajesh Kumar: Theft case under Section 379 IPC.",
+    "The defendant committed theft under IPC Section 379.",
+]
+
 
 @pytest.fixture(scope="session")
 def test_data_dir():
@@ -16,6 +33,94 @@ def test_data_dir():
     return Path(__file__).parent / "test_data"
 
 
+@pytest.fixture(scope="session")
+def precedent_db_path(tmp_path_factory):
+    """One FAISS store directory for the whole session, used in place of precedent_index."""
+    db_path = str(tmp_path_factory.mktemp("precedent_index"))
+    try:
+        import inlegalbert_helper
+        import agent1_inlegal_faiss
+    except Exception as e:
+        pytest.skip(f"Could not import agent1_inlegal_faiss: {e}")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(inlegalbert_helper, "DB_PATH", db_path)
+        mp.setattr(agent1_inlegal_faiss, "DB_PATH", db_path)
+        yield db_path
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_collection_modifyitems(config, items):
+    """Keep model tests on one xdist worker (--dist=loadgroup) so the models load once."""
+    for item in items:
+        if item.get_closest_marker("model"):
+            item.add_marker(pytest.mark.xdist_group("model"))
+
+
+@pytest.fixture(scope="session")
+def app_client(precedent_db_path):
+    """Session-wide test client for the Agent 1 InLegalBERT service."""
+    from agent1_inlegal_faiss import app
+    return TestClient(app)
+
+
+@pytest.fixture(scope="session")
+def models_ready(app_client):
+    """
+    Load the models once per worker and embed every test text in one batch.
+    The load gets MODEL_LOAD_TIMEOUT seconds of its own (per-test timeouts
+    only cover the test body, see pytest.ini); if it fails or runs out of
+    time, every model test is skipped.
+    """
+    from inlegalbert_helper import warmup_models, embed_texts
+    outcome = {}
+
+    def load():
+        try:
+            outcome["loaded"] = warmup_models() and embed_texts(EMBED_TEXTS) is not None
+        except Exception as e:
+            outcome["error"] = e
+
+    loader = threading.Thread(target=load, daemon=True)
+    loader.start()
+    loader.join(MODEL_LOAD_TIMEOUT)
+    if loader.is_alive():
+        pytest.skip(f"InLegalBERT did not load within {MODEL_LOAD_TIMEOUT:.0f}s")
+    if not outcome.get("loaded"):
+        pytest.skip(f"InLegalBERT not available: {outcome.get('error', 'models failed to load')}")
+    return True
+
+
+@pytest.fixture(autouse=True)
+def _require_models(request):
+    """Only tests marked model wait for the models, and they skip without them."""
+    if request.node.get_closest_marker("model"):
+        request.getfixturevalue("models_ready")
+
+
+@pytest.fixture(autouse=True)
+def rollback_index(precedent_db_path):
+    """
+    Roll the shared precedent store back to its state before the test,
+    instead of recreating it for every test. Tests that add nothing cost nothing.
+    """
+    from inlegalbert_helper import load_or_create_faiss, clear_faiss, add_precedents, precedent_text_file
+    index, meta, _, _ = load_or_create_faiss()
+    snapshot = len(meta)
+    yield
+    index, meta, _, _ = load_or_create_faiss()
+    if len(meta) <= snapshot:
+        return
+    # HNSW indexes cannot remove vectors, so keep the first rows and rebuild
+    kept_vectors = index.reconstruct_n(0, snapshot) if snapshot else None
+    kept_entries = []
+    for row, entry in enumerate(meta[:snapshot]):
+        with open(precedent_text_file(row), encoding="utf-8") as f:
+            kept_entries.append({**entry, "text": f.read()})
+    clear_faiss()
+    if kept_entries:
+        add_precedents(kept_vectors, kept_entries)
+
+
 @pytest.fixture(autouse=True)
 def cleanup_test_files():
     """Cleanup test files after each test."""
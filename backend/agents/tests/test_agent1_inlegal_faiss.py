@@ -13,39 +13,21 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from fastapi.testclient import TestClient
 import json
-import tempfile
-import shutil
 
 # Set environment variable to skip model downloads if needed
 os.environ.setdefault("TRANSFORMERS_OFFLINE", "0")
 
 
 @pytest.fixture(scope="module")
-def client():
-    """Create a test client for the FastAPI app."""
-    # Import here to avoid loading models during test discovery
-    try:
-        from agent1_inlegal_faiss import app
-        return TestClient(app)
-    except Exception as e:
-        pytest.skip(f"Could not import agent1_inlegal_faiss: {e}")
+def client(app_client):
+    """Test client for the FastAPI app (shared across the session)."""
+    return app_client
 
 
 @pytest.fixture
-def temp_db_path(monkeypatch):
-    """Create a temporary directory for FAISS index during tests."""
-    temp_dir = tempfile.mkdtemp()
-    original_path = os.path.join(os.path.dirname(__file__), "..", "precedent_index")
-    
-    # Monkey patch the DB_PATH
-    import agent1_inlegal_faiss
-    monkeypatch.setattr(agent1_inlegal_faiss, "DB_PATH", temp_dir)
-    
-    yield temp_dir
-    
-    # Cleanup
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
+def temp_db_path(precedent_db_path):
+    """FAISS store directory for a test (rolled back after each test)."""
+    return precedent_db_path
 
 
 def test_health_endpoint(client):
@@ -60,24 +42,19 @@ def test_health_endpoint(client):
 
 
 @pytest.mark.timeout(30)
+@pytest.mark.model
 def test_embed_endpoint_basic(client):
     """Test embedding endpoint with valid text."""
-    try:
-        response = client.post("/embed", json={"text": "This is a test legal case."}, timeout=25.0)
-    except Exception:
-        # If request times out, skip this test (models may be downloading)
-        pytest.skip("Request timed out - models may be downloading")
+    response = client.post("/embed", json={"text": "This is a test legal case."})
     
-    # Should return 200 if models are loaded, or 503 if not
-    assert response.status_code in [200, 503]
+    assert response.status_code == 200
     
-    if response.status_code == 200:
-        data = response.json()
-        assert "embedding" in data
-        assert "dimension" in data
-        assert data["dimension"] == 768
-        assert len(data["embedding"]) == 768
-        assert all(isinstance(x, (int, float)) for x in data["embedding"])
+    data = response.json()
+    assert "embedding" in data
+    assert "dimension" in data
+    assert data["dimension"] == 768
+    assert len(data["embedding"]) == 768
+    assert all(isinstance(x, (int, float)) for x in data["embedding"])
 
 
 def test_embed_endpoint_empty_text(client):
@@ -94,33 +71,28 @@ def test_embed_endpoint_missing_text(client):
 
 
 @pytest.mark.timeout(30)
+@pytest.mark.model
 def test_analyze_endpoint_basic(client, temp_db_path):
     """Test analyze endpoint with valid text."""
-    try:
-        response = client.post(
-            "/analyze",
-            json={
-                "text": "The defendant was charged with theft under Section 379 of IPC.",
-                "top_k_precedents": 3
-            },
-            timeout=25.0
-        )
-    except Exception:
-        pytest.skip("Request timed out - models may be downloading")
+    response = client.post(
+        "/analyze",
+        json={
+            "text": "The defendant was charged with theft under Section 379 of IPC.",
+            "top_k_precedents": 3
+        }
+    )
     
-    # Should return 200 if models are loaded, or 503 if not
-    assert response.status_code in [200, 503]
+    assert response.status_code == 200
     
-    if response.status_code == 200:
-        data = response.json()
-        assert "ner" in data
-        assert "embedding_dim" in data
-        assert "precedents" in data
-        assert "total_precedents_in_db" in data
-        assert data["embedding_dim"] == 768
-        assert isinstance(data["ner"], list)
-        assert isinstance(data["precedents"], list)
-        assert isinstance(data["total_precedents_in_db"], int)
+    data = response.json()
+    assert "ner" in data
+    assert "embedding_dim" in data
+    assert "precedents" in data
+    assert "total_precedents_in_db" in data
+    assert data["embedding_dim"] == 768
+    assert isinstance(data["ner"], list)
+    assert isinstance(data["precedents"], list)
+    assert isinstance(data["total_precedents_in_db"], int)
 
 
 def test_analyze_endpoint_invalid_top_k(client):
@@ -145,50 +117,42 @@ def test_analyze_endpoint_invalid_top_k(client):
 
 
 @pytest.mark.timeout(30)
+@pytest.mark.model
 def test_add_precedent_endpoint(client, temp_db_path):
     """Test adding a precedent to the database."""
-    try:
-        response = client.post(
-            "/add_precedent",
-            json={
-                "text": "State of Maharashtra vs Rajesh Kumar: The court held that...",
-                "id": "test_case_001"
-            },
-            timeout=25.0
-        )
-    except Exception:
-        pytest.skip("Request timed out - models may be downloading")
+    response = client.post(
+        "/add_precedent",
+        json={
+            "text": "State of Maharashtra vs Rajesh Kumar: The court held that...",
+            "id": "test_case_001"
+        }
+    )
     
-    # Should return 200 if models are loaded, or 503 if not
-    assert response.status_code in [200, 503]
+    assert response.status_code == 200
     
-    if response.status_code == 200:
-        data = response.json()
-        assert "message" in data
-        assert "total" in data
-        assert "case_id" in data
-        assert data["case_id"] == "test_case_001"
-        assert data["total"] == 1
+    data = response.json()
+    assert "message" in data
+    assert "total" in data
+    assert "case_id" in data
+    assert data["case_id"] == "test_case_001"
+    assert data["total"] == 1
 
 
 @pytest.mark.timeout(30)
+@pytest.mark.model
 def test_add_precedent_endpoint_auto_id(client, temp_db_path):
     """Test adding a precedent without explicit ID."""
-    try:
-        response = client.post(
-            "/add_precedent",
-            json={
-                "text": "Another test case precedent."
-            },
-            timeout=25.0
-        )
-    except Exception:
-        pytest.skip("Request timed out - models may be downloading")
+    response = client.post(
+        "/add_precedent",
+        json={
+            "text": "Another test case precedent."
+        }
+    )
+    assert response.status_code == 200
     
-    if response.status_code == 200:
-        data = response.json()
-        assert "case_id" in data
-        assert data["total"] == 1
+    data = response.json()
+    assert "case_id" in data
+    assert data["total"] == 1
 
 
 def test_add_precedent_endpoint_empty_text(client):
@@ -211,6 +175,7 @@ def test_precedent_count_endpoint(client, temp_db_path):
         assert isinstance(data["total"], int)
 
 
+@pytest.mark.model
 def test_clear_precedents_endpoint(client, temp_db_path):
     """Test clearing all precedents."""
     # First add a precedent
@@ -229,50 +194,42 @@ def test_clear_precedents_endpoint(client, temp_db_path):
 
 
 @pytest.mark.timeout(60)
+@pytest.mark.model
 def test_analyze_with_precedents(client, temp_db_path):
     """Test analyze endpoint after adding precedents."""
-    try:
-        # Add a precedent
-        add_response = client.post(
-            "/add_precedent",
-            json={
-                "text": "State of Maharashtra vs Rajesh Kumar: Theft case under Section 379 IPC.",
-                "id": "precedent_001"
-            },
-            timeout=25.0
-        )
-    except Exception:
-        pytest.skip("Request timed out - models may be downloading")
+    # Add a precedent
+    add_response = client.post(
+        "/add_precedent",
+        json={
+            "text": "State of Maharashtra vs Rajesh Kumar: Theft case under Section 379 IPC.",
+            "id": "precedent_001"
+        }
+    )
+    assert add_response.status_code == 200
+    
+    # Now analyze similar text
+    analyze_response = client.post(
+        "/analyze",
+        json={
+            "text": "The defendant committed theft under IPC Section 379.",
+            "top_k_precedents": 1
+        }
+    )
+    assert analyze_response.status_code == 200
     
-    if add_response.status_code == 200:
-        try:
-            # Now analyze similar text
-            analyze_response = client.post(
-                "/analyze",
-                json={
-                    "text": "The defendant committed theft under IPC Section 379.",
-                    "top_k_precedents": 1
-                },
-                timeout=25.0
-            )
-        except Exception:
-            pytest.skip("Request timed out - models may be downloading")
-        
-        if analyze_response.status_code == 200:
-            data = analyze_response.json()
-            assert len(data["precedents"]) > 0
-            precedent = data["precedents"][0]
-            assert "text" in precedent
-            assert "distance" in precedent
-            assert "case_id" in precedent
-            assert "similarity_score" in precedent
+    data = analyze_response.json()
+    assert len(data["precedents"]) > 0
+    precedent = data["precedents"][0]
+    assert "text" in precedent
+    assert "distance" in precedent
+    assert "case_id" in precedent
+    assert "similarity_score" in precedent
 
 
 def test_cors_headers(client):
-    """Test that CORS headers are properly set."""
-    response = client.options("/health")
-    # CORS middleware should handle OPTIONS requests
-    assert response.status_code in [200, 405]  # 405 if OPTIONS not explicitly handled
+    """Test that the CORS middleware is mounted."""
+    from fastapi.middleware.cors import CORSMiddleware
+    assert any(m.cls is CORSMiddleware for m in client.app.user_middleware)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,178 @@
+"""
+Tests for Agent 2 (human feedback): feedback versions, version reconstruction
+and paginated history, against the in-memory store and Redis (via fakeredis).
+"""
+import asyncio
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import agent2
+from agent2 import CaseDocument, FeedbackItem, feedback_overlays, process_feedback, reconstruct
+
+
+def add_facts(content, status="needs_revision"):
+    """Feedback adding one entry to the facts section"""
+    return {
+        "approval_status": status,
+        "feedback_items": [{"section": "facts", "feedback_type": "add", "content": content, "action": "add fact"}],
+    }
+
+
+# Changes facts twice, then only approves (no new version)
+FEEDBACKS = [add_facts("a"), add_facts("b"), {"approval_status": "approved"}]
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request, monkeypatch, tmp_path):
+    """A fresh case store for agent2; history spills go to a temporary directory"""
+    monkeypatch.setattr(agent2, "HISTORY_PATH", str(tmp_path / "feedback_history"))
+    monkeypatch.setattr(agent2, "_response_cache", agent2.TTLCache(maxsize=agent2.RESPONSE_CACHE_SIZE,
+                                                                     ttl=agent2.RESPONSE_CACHE_TTL))
+    if request.param == "redis":
+        if not agent2.REDIS_AVAILABLE:
+            pytest.skip("redis is not installed")
+        fakeredis = pytest.importorskip("fakeredis")
+        case_store = agent2.RedisCaseStore(fakeredis.aioredis.FakeRedis())
+    else:
+        case_store = agent2.InMemoryCaseStore()
+    monkeypatch.setattr(agent2, "case_store", case_store)
+    return case_store
+
+
+def run_with_client(scenario):
+    """Run scenario(client) against the agent2 app on a new event loop"""
+    async def main():
+        transport = httpx.ASGITransport(app=agent2.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://agent2") as client:
+            return await scenario(client)
+
+    return asyncio.run(main())
+
+
+async def document_state(client, case_id):
+    """The current document and every earlier version of a case (without modification times)"""
+    current = (await client.get(f"/documents/{case_id}")).json()
+    versions = []
+    for version in range(1, current["version"] + 1):
+        document = (await client.get(f"/documents/{case_id}/versions/{version}")).json()["document"]
+        document.get("_metadata", {}).pop("last_modified", None)
+        versions.append(document)
+    return current["version"], current["status"], current["feedback_count"], versions
+
+
+def test_concurrent_feedback_matches_sequential(store):
+    """Feedback submitted concurrently gets the same versions as feedback submitted one at a time"""
+    async def scenario(client):
+        results = {}
+        for mode in ("sequential", "concurrent"):
+            case_id = f"case-{mode}"
+            await client.post("/documents/submit", params={"case_id": case_id}, json={"facts": []})
+            requests = [client.post(f"/documents/{case_id}/feedback", json=feedback) for feedback in FEEDBACKS]
+            if mode == "concurrent":
+                responses = await asyncio.gather(*requests)
+            else:
+                responses = [await request for request in requests]
+            assert all(response.status_code == 200 for response in responses)
+            results[mode] = ([response.json()["version"] for response in responses],
+                             await document_state(client, case_id))
+        return results
+
+    results = run_with_client(scenario)
+
+    assert results["concurrent"] == results["sequential"]
+    versions, (version, status, feedback_count, documents) = results["sequential"]
+    assert versions == [2, 3, 3]
+    assert (version, status, feedback_count) == (3, "approved", 3)
+    assert [document["facts"] for document in documents] == [[], ["a"], ["b"]]
+
+
+def test_reconstruct_add_edit_delete_runs():
+    """Interleaved runs of add/edit/delete apply in submission order over the original"""
+    original = {"facts": ["f1"], "issues": "old issues", "notes": "old notes", "ruling": "pending"}
+    items = [
+        FeedbackItem(section="facts", feedback_type="add", content="f2", action="add"),
+        FeedbackItem(section="facts", feedback_type="add", content="f3", action="add"),
+        FeedbackItem(section="issues", feedback_type="edit", content="draft", action="edit"),
+        FeedbackItem(section="issues", feedback_type="edit", content="new issues", action="edit"),
+        FeedbackItem(section="notes", feedback_type="delete", action="delete"),
+        FeedbackItem(section="notes", feedback_type="add", content="n1", action="add"),
+        FeedbackItem(section="ruling", feedback_type="delete", action="delete"),
+        FeedbackItem(section="ruling", feedback_type="approve", action="approve"),
+    ]
+    now = datetime.now()
+    doc = CaseDocument(case_id="c", original_document=original, created_at=now, updated_at=now)
+    doc.versions[2] = process_feedback(original, items, 1, now)
+    doc.version = 2
+
+    document = reconstruct(doc, 2)
+
+    assert document["facts"] == ["f1", "f2", "f3"]
+    assert document["issues"] == "new issues"
+    assert document["notes"] == ["n1"]
+    assert "ruling" not in document
+    assert document["_metadata"]["modified_version"] == 2
+    assert doc.versions[2].deleted == ["ruling"]
+    assert reconstruct(doc, 1) == original
+    assert original == {"facts": ["f1"], "issues": "old issues", "notes": "old notes", "ruling": "pending"}
+
+
+def test_feedback_overlays_one_version_per_change():
+    """Each changing feedback builds on the version before it; the rest create no version"""
+    feedbacks = [agent2.HumanFeedback(**feedback) for feedback in FEEDBACKS]
+
+    overlays = feedback_overlays({"facts": []}, feedbacks, 1)
+
+    assert [overlay and overlay.overlay["_metadata"]["modified_version"] for overlay in overlays] == [2, 3, None]
+
+
+def test_history_pagination_across_spill(store, monkeypatch):
+    """Walking history pages backwards returns every entry once, including those spilled to disk"""
+    monkeypatch.setattr(agent2, "HISTORY_IN_MEMORY", 3)
+    notes = [f"note {i}" for i in range(8)]
+
+    async def scenario(client):
+        case_id = "case-history"
+        await client.post("/documents/submit", params={"case_id": case_id}, json={"facts": []})
+        for note in notes:
+            response = await client.post(f"/documents/{case_id}/feedback", json={"approval_status": "pending", "reviewer_notes": note})
+            assert response.status_code == 200
+
+        pages, before = [], None
+        while True:
+            params = {"limit": 3} if before is None else {"limit": 3, "before": before}
+            page = (await client.get(f"/documents/{case_id}/history", params=params)).json()
+            assert page["total"] == len(notes)
+            pages.append([entry["reviewer_notes"] for entry in page["feedback_history"]])
+            before = page["next_before"]
+            if before is None:
+                return pages
+
+    pages = run_with_client(scenario)
+
+    assert pages == [notes[5:8], notes[2:5], notes[0:2]]
+
+
+def test_resubmit_clears_history(store, monkeypatch):
+    """Resubmitting a case starts its feedback history over, spilled entries included"""
+    monkeypatch.setattr(agent2, "HISTORY_IN_MEMORY", 2)
+
+    async def scenario(client):
+        case_id = "case-resubmit"
+        await client.post("/documents/submit", params={"case_id": case_id}, json={"facts": []})
+        for i in range(5):
+            await client.post(f"/documents/{case_id}/feedback", json={"approval_status": "pending", "reviewer_notes": f"old {i}"})
+        await client.post("/documents/submit", params={"case_id": case_id}, json={"facts": []})
+        await client.post(f"/documents/{case_id}/feedback", json={"approval_status": "pending", "reviewer_notes": "new"})
+        return (await client.get(f"/documents/{case_id}/history")).json()
+
+    history = run_with_client(scenario)
+
+    assert history["total"] == 1
+    assert [entry["reviewer_notes"] for entry in history["feedback_history"]] == ["new"]
@@ -0,0 +1,114 @@
+"""
+Verdict Cache Module
+Exact-match and same-facts cache of LLM verdict predictions for Agent 3.
+Repeat cases, and cases with the same key facts and legal issues, are
+answered from cache instead of re-sending the full prompt to OpenAI.
+"""
+import os
+import json
+import copy
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Optional
+from cachetools import TTLCache
+
+CACHE_PATH = os.path.join(os.path.dirname(__file__), "verdict_cache")
+EXACT_CACHE_SIZE = 1024
+EXACT_CACHE_TTL = 3600  # seconds
+FACTS_CACHE_SIZE = 5000  # least recently used entries are dropped beyond this
+
+# Case fields the verdict prompt is built from (case_id is not part of it)
+CASE_FIELDS = ("case_summary", "key_facts", "legal_issues", "entities", "timeline")
+
+# Verdict reasoning cites these, so a case differing only in its summary,
+# entities or timeline can reuse the verdict of a case that matches them exactly
+FACT_FIELDS = ("key_facts", "legal_issues")
+
+# Global cache state
+_exact: TTLCache = TTLCache(maxsize=EXACT_CACHE_SIZE, ttl=EXACT_CACHE_TTL)
+_by_facts: "OrderedDict[str, Dict]" = OrderedDict()  # facts key -> verdict, oldest first
+_loaded = False
+
+
+def _case_key(case_data: Dict, fields=CASE_FIELDS) -> str:
+    """BLAKE2b key of the canonical JSON of the given case fields."""
+    canonical = json.dumps({field: case_data.get(field) for field in fields},
+                           sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=32).hexdigest()
+
+
+def _ensure_loaded():
+    """Load the persisted cache from disk on first use."""
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    entries_file = os.path.join(CACHE_PATH, "cache.json")
+    if os.path.exists(entries_file):
+        try:
+            with open(entries_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            for entry in entries[-FACTS_CACHE_SIZE:]:
+                _by_facts[entry["facts_key"]] = entry["verdict"]
+            print(f"✅ Loaded verdict cache with {len(_by_facts)} entries")
+        except Exception as e:
+            print(f"⚠️ Error loading verdict cache: {e}. Starting empty.")
+            _by_facts.clear()
+
+
+def lookup(case_data: Dict) -> Optional[Dict]:
+    """
+    Find a cached verdict for a case.
+
+    Args:
+        case_data: Normalized case data the verdict prompt is built from
+
+    Returns:
+        Copy of the cached verdict, or None on a miss
+    """
+    _ensure_loaded()
+
+    cached = _exact.get(_case_key(case_data))
+    if cached is None:
+        facts_key = _case_key(case_data, FACT_FIELDS)
+        cached = _by_facts.get(facts_key)
+        if cached is not None:
+            _by_facts.move_to_end(facts_key)
+            print("Verdict cache hit on identical key facts and legal issues")
+
+    return copy.deepcopy(cached) if cached is not None else None
+
+
+def store(case_data: Dict, verdict: Dict):
+    """
+    Cache a successful verdict for a case.
+
+    Args:
+        case_data: Normalized case data the verdict prompt was built from
+        verdict: Parsed verdict returned by the LLM
+    """
+    _ensure_loaded()
+
+    verdict = copy.deepcopy(verdict)
+    _exact[_case_key(case_data)] = verdict
+    facts_key = _case_key(case_data, FACT_FIELDS)
+    _by_facts[facts_key] = verdict
+    _by_facts.move_to_end(facts_key)
+    while len(_by_facts) > FACTS_CACHE_SIZE:
+        _by_facts.popitem(last=False)
+
+
+def save_cache():
+    """Persist the same-facts cache to disk."""
+    if not _by_facts:
+        return
+
+    try:
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        entries = [{"facts_key": key, "verdict": verdict} for key, verdict in _by_facts.items()]
+        with open(os.path.join(CACHE_PATH, "cache.json"), "w", encoding="utf-8") as f:
+            json.dump(entries, f, ensure_ascii=False)
+        print(f"💾 Saved verdict cache with {len(entries)} entries")
+    except Exception as e:
+        print(f"❌ Error saving verdict cache: {e}")
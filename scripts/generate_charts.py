@@ -10,20 +10,31 @@ Generates PNG charts from analytics data:
 - retrieval_latency.png
 
 Usage:
-    pip install matplotlib pandas
+    pip install matplotlib pandas ijson  # ijson is optional
     python3 scripts/generate_charts.py
+    python3 scripts/generate_charts.py --input scripts/_charts_fixture.json  # no benchmark needed
 
 ============================================================================
 """
 
+import argparse
 import json
 import os
 import sys
 from pathlib import Path
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend
-import matplotlib.pyplot as plt
-import pandas as pd
+
+# matplotlib and pandas are imported by init_plotting() once there are cases to chart
+plt = None
+pd = None
+
+# ijson streams the cases out of large analytics files (optional)
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+    JSON_ERRORS = (json.JSONDecodeError, ijson.JSONError)
+except ImportError:
+    IJSON_AVAILABLE = False
+    JSON_ERRORS = (json.JSONDecodeError,)
 
 # ============================================================================
 # CONFIGURATION
@@ -34,8 +45,16 @@ ANALYTICS_FILE = BASE_DIR / "backend" / "api" / "data" / "analytics.json"
 SUMMARY_FILE = BASE_DIR / "backend" / "api" / "data" / "analytics_summary.json"
 CHARTS_DIR = BASE_DIR / "backend" / "api" / "data" / "charts"
 
+# Case fields the charts are built from
+CASE_COLUMNS = [
+    'case_id', 'uploaded_at', 'processing_time_seconds', 'retrieval_latency_ms',
+    'extraction_precision', 'extraction_recall', 'extraction_f1'
+]
+METRIC_COLUMNS = ['extraction_precision', 'extraction_recall', 'extraction_f1']
+
 # Chart style
-plt.style.use('dark_background')
+BACKGROUND = '#0f172a'
+CHART_DPI = 150  # Dashboard-sized PNGs
 COLORS = {
     'primary': '#60a5fa',
     'secondary': '#a78bfa',
@@ -48,23 +67,48 @@ COLORS = {
 # UTILITY FUNCTIONS
 # ============================================================================
 
+def init_plotting():
+    """Import matplotlib and pandas and apply the chart style"""
+    global plt, pd
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    plt.style.use('dark_background')
+
 def ensure_charts_dir():
     """Ensure charts directory exists"""
     CHARTS_DIR.mkdir(parents=True, exist_ok=True)
 
-def load_analytics():
-    """Load analytics data from JSON file"""
+def chart_fields(case):
+    """Keep only the fields of a case the charts use"""
+    return {key: case[key] for key in CASE_COLUMNS if key in case}
+
+def load_analytics(path=None):
+    """Load the chart fields of every case from the analytics JSON file (ANALYTICS_FILE by default)"""
+    path = path or ANALYTICS_FILE
     try:
-        with open(ANALYTICS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return data.get('cases', [])
+        with open(path, 'rb') as f:
+            if IJSON_AVAILABLE:
+                # Parse one case at a time instead of building the whole JSON tree
+                return [chart_fields(case) for case in ijson.items(f, 'cases.item', use_float=True)]
+            return [chart_fields(case) for case in json.load(f).get('cases', [])]
     except FileNotFoundError:
-        print(f"Warning: {ANALYTICS_FILE} not found. No analytics data available.")
+        print(f"Warning: {path} not found. No analytics data available.")
         return []
-    except json.JSONDecodeError as e:
-        print(f"Error parsing {ANALYTICS_FILE}: {e}")
+    except JSON_ERRORS as e:
+        print(f"Error parsing {path}: {e}")
         return []
 
+def cases_frame(cases):
+    """Build one DataFrame of the chart fields, sorted by uploaded_at (cases without one first)"""
+    df = pd.DataFrame(cases).reindex(columns=CASE_COLUMNS)
+    return df.sort_values('uploaded_at', key=lambda s: s.fillna(''), kind='stable')
+
+def recent(df, count=20):
+    """Last count cases of an uploaded_at-sorted frame"""
+    return df.tail(count)
+
 def load_summary():
     """Load analytics summary from JSON file"""
     try:
@@ -81,74 +125,77 @@ def load_summary():
 # CHART GENERATION
 # ============================================================================
 
-def generate_processing_time_trend(cases):
-    """Generate processing time trend chart"""
-    if not cases:
+def create_chart_axes():
+    """Create the one dark-styled figure every chart is drawn on"""
+    fig, ax = plt.subplots(figsize=(12, 6))
+    fig.patch.set_facecolor(BACKGROUND)
+    # Fixed margins (room for rotated tick labels) instead of measuring each chart
+    fig.subplots_adjust(left=0.08, right=0.98, top=0.92, bottom=0.15)
+    return ax
+
+def start_chart(ax, width=12):
+    """Clear the shared axes for the next chart"""
+    ax.cla()
+    ax.figure.set_size_inches(width, 6)
+    ax.set_facecolor(BACKGROUND)
+
+def save_chart(ax, filename):
+    """Save the shared figure as a PNG in the charts directory"""
+    output_path = CHARTS_DIR / filename
+    ax.figure.savefig(output_path, dpi=CHART_DPI, facecolor=BACKGROUND)
+    print(f"✅ Generated: {output_path}")
+
+def generate_processing_time_trend(ax, recent_cases):
+    """Generate processing time trend chart from the most recent cases"""
+    if recent_cases.empty:
         print("No cases data available for processing time trend")
         return
 
-    # Sort by uploaded_at
-    sorted_cases = sorted(cases, key=lambda x: x.get('uploaded_at', ''))
-    
-    # Get last 20 cases
-    recent_cases = sorted_cases[-20:]
-    
     # Extract data
-    case_ids = [c.get('case_id', f"Case {i}") for i, c in enumerate(recent_cases)]
-    processing_times = [c.get('processing_time_seconds', 0) for c in recent_cases]
+    processing_times = recent_cases['processing_time_seconds'].fillna(0).to_numpy()
     
     # Create chart
-    fig, ax = plt.subplots(figsize=(12, 6))
+    start_chart(ax)
     ax.plot(range(len(recent_cases)), processing_times, 
-            marker='o', color=COLORS['primary'], linewidth=2, markersize=6)
+            marker='o', color=COLORS['primary'], linewidth=2, markersize=6, rasterized=True)
     ax.fill_between(range(len(recent_cases)), processing_times, 
-                    alpha=0.3, color=COLORS['primary'])
+                    alpha=0.3, color=COLORS['primary'], rasterized=True)
     
     ax.set_xlabel('Case Index (Recent Cases)', fontsize=12, color='white')
     ax.set_ylabel('Processing Time (seconds)', fontsize=12, color='white')
     ax.set_title('Processing Time Trend (Last 20 Cases)', fontsize=14, color='white', pad=20)
     ax.grid(True, alpha=0.3, color='white')
-    ax.set_facecolor('#0f172a')
-    fig.patch.set_facecolor('#0f172a')
     
     # Rotate x-axis labels if needed
     if len(recent_cases) > 10:
-        plt.xticks(rotation=45, ha='right')
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
     
-    plt.tight_layout()
-    output_path = CHARTS_DIR / "processing_time_trend.png"
-    plt.savefig(output_path, dpi=300, bbox_inches='tight', facecolor='#0f172a')
-    plt.close()
-    print(f"✅ Generated: {output_path}")
+    save_chart(ax, "processing_time_trend.png")
 
-def generate_extraction_metrics(cases):
+def generate_extraction_metrics(ax, df):
     """Generate extraction metrics bar chart"""
-    if not cases:
+    if df.empty:
         print("No cases data available for extraction metrics")
         return
 
-    # Filter cases with metrics
-    cases_with_metrics = [c for c in cases 
-                         if c.get('extraction_precision') is not None 
-                         and c.get('extraction_recall') is not None]
+    # Cases with metrics (a missing F1 counts as 0)
+    cases_with_metrics = df.dropna(subset=['extraction_precision', 'extraction_recall'])
     
-    if not cases_with_metrics:
+    if cases_with_metrics.empty:
         print("No cases with extraction metrics available")
         return
 
     # Calculate averages
-    avg_precision = sum(c.get('extraction_precision', 0) for c in cases_with_metrics) / len(cases_with_metrics)
-    avg_recall = sum(c.get('extraction_recall', 0) for c in cases_with_metrics) / len(cases_with_metrics)
-    avg_f1 = sum(c.get('extraction_f1', 0) for c in cases_with_metrics) / len(cases_with_metrics)
+    avg_precision, avg_recall, avg_f1 = cases_with_metrics[METRIC_COLUMNS].fillna(0).astype(float).mean()
 
     # Create chart
-    fig, ax = plt.subplots(figsize=(10, 6))
+    start_chart(ax, width=10)
     
     metrics = ['Precision', 'Recall', 'F1 Score']
     values = [avg_precision * 100, avg_recall * 100, avg_f1 * 100]
     colors = [COLORS['primary'], COLORS['secondary'], COLORS['success']]
     
-    bars = ax.bar(metrics, values, color=colors, alpha=0.8, edgecolor='white', linewidth=1.5)
+    bars = ax.bar(metrics, values, color=colors, alpha=0.8, edgecolor='white', linewidth=1.5, rasterized=True)
     
     # Add value labels on bars
     for bar, val in zip(bars, values):
@@ -161,65 +208,48 @@ def generate_extraction_metrics(cases):
     ax.set_title('Extraction Metrics (Average)', fontsize=14, color='white', pad=20)
     ax.set_ylim(0, 100)
     ax.grid(True, alpha=0.3, color='white', axis='y')
-    ax.set_facecolor('#0f172a')
-    fig.patch.set_facecolor('#0f172a')
     
-    plt.tight_layout()
-    output_path = CHARTS_DIR / "extraction_metrics.png"
-    plt.savefig(output_path, dpi=300, bbox_inches='tight', facecolor='#0f172a')
-    plt.close()
-    print(f"✅ Generated: {output_path}")
-
-def generate_retrieval_latency(cases):
-    """Generate retrieval latency chart"""
-    if not cases:
-        print("No cases data available for retrieval latency")
-        return
+    save_chart(ax, "extraction_metrics.png")
 
-    # Filter cases with retrieval latency
-    cases_with_latency = [c for c in cases if c.get('retrieval_latency_ms') is not None]
-    
-    if not cases_with_latency:
+def generate_retrieval_latency(ax, recent_cases):
+    """Generate retrieval latency chart from the most recent cases with a retrieval latency"""
+    if recent_cases.empty:
         print("No cases with retrieval latency data available")
         return
 
-    # Sort by uploaded_at
-    sorted_cases = sorted(cases_with_latency, key=lambda x: x.get('uploaded_at', ''))
-    
-    # Get last 20 cases
-    recent_cases = sorted_cases[-20:]
-    
     # Extract data
-    case_ids = [c.get('case_id', f"Case {i}") for i, c in enumerate(recent_cases)]
-    latencies = [c.get('retrieval_latency_ms', 0) for c in recent_cases]
+    latencies = recent_cases['retrieval_latency_ms'].to_numpy()
     
     # Create chart
-    fig, ax = plt.subplots(figsize=(12, 6))
+    start_chart(ax)
     ax.bar(range(len(recent_cases)), latencies, 
-           color=COLORS['secondary'], alpha=0.8, edgecolor='white', linewidth=1)
+           color=COLORS['secondary'], alpha=0.8, edgecolor='white', linewidth=1, rasterized=True)
     
     ax.set_xlabel('Case Index (Recent Cases)', fontsize=12, color='white')
     ax.set_ylabel('Retrieval Latency (ms)', fontsize=12, color='white')
     ax.set_title('Retrieval Latency (Last 20 Cases)', fontsize=14, color='white', pad=20)
     ax.grid(True, alpha=0.3, color='white', axis='y')
-    ax.set_facecolor('#0f172a')
-    fig.patch.set_facecolor('#0f172a')
     
     # Rotate x-axis labels if needed
     if len(recent_cases) > 10:
-        plt.xticks(rotation=45, ha='right')
+        plt.setp(ax.get_xticklabels(), rotation=45, ha='right')
     
-    plt.tight_layout()
-    output_path = CHARTS_DIR / "retrieval_latency.png"
-    plt.savefig(output_path, dpi=300, bbox_inches='tight', facecolor='#0f172a')
-    plt.close()
-    print(f"✅ Generated: {output_path}")
+    save_chart(ax, "retrieval_latency.png")
 
 # ============================================================================
 # MAIN
 # ============================================================================
 
-def main():
+def parse_args(argv=None):
+    """Parse the command line"""
+    parser = argparse.ArgumentParser(description="Generate PNG charts from analytics data")
+    parser.add_argument('--input', type=Path, default=None,
+                        help=f"analytics JSON to read instead of {ANALYTICS_FILE}")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+
     print("\n" + "="*60)
     print("📊 JUSTICE AI - CHART GENERATOR")
     print("="*60 + "\n")
@@ -228,7 +258,7 @@ def main():
     ensure_charts_dir()
     
     # Load data
-    cases = load_analytics()
+    cases = load_analytics(args.input)
     summary = load_summary()
     
     if not cases:
@@ -237,11 +267,16 @@ def main():
         return
     
     print(f"📈 Generating charts from {len(cases)} cases...\n")
+    init_plotting()
     
     # Generate charts
-    generate_processing_time_trend(cases)
-    generate_extraction_metrics(cases)
-    generate_retrieval_latency(cases)
+    # Sorted once; both trend charts take their last 20 cases from it
+    df = cases_frame(cases)
+    ax = create_chart_axes()
+    generate_processing_time_trend(ax, recent(df))
+    generate_extraction_metrics(ax, df)
+    generate_retrieval_latency(ax, recent(df[df['retrieval_latency_ms'].notna()]))
+    plt.close(ax.figure)
     
     print(f"\n✅ All charts generated successfully!")
     print(f"📁 Charts saved to: {CHARTS_DIR}\n")